@@ -1,16 +1,49 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, session, abort
+from flask import Flask, Request, current_app, render_template, redirect, url_for, request, flash, session, abort, g, has_request_context, make_response
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import safe_join
 from config import Config
-from datetime import datetime
+from datetime import datetime, timedelta
+from bisect import bisect_left, insort
 import random, string
+import threading
+import json
+import os
+import gzip
+import mimetypes
+import queue
+import atexit
+import time
+import hashlib
+import sqlite3
+import tempfile
+import base64
+import re
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+import click
 from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 
 
 
+class BiokuizRequest(Request):
+    @property
+    def max_content_length(self):
+        # file bank soal boleh lebih besar dari batas umum (gambar + form)
+        if self.endpoint == 'admin_question_import':
+            return current_app.config['QUESTION_IMPORT_MAX_BYTES']
+        return super().max_content_length
+
+
 app = Flask(__name__)
+app.request_class = BiokuizRequest
 app.config.from_object(Config)
 
 mail = Mail(app)
@@ -21,6 +54,23 @@ db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+
+# PRAGMA SQLite dari profil database dipasang di setiap koneksi baru
+def install_sqlite_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+with app.app_context():
+    install_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+
 # Fungsi untuk menentukan level berdasarkan skor
 def get_level(avg_score):
     if avg_score >= 80:
@@ -37,6 +87,50 @@ def only_admin():
         abort(403)
 
 
+def parse_choices(raw):
+    if not raw:
+        return None
+    out = []
+    for part in raw.split(';;'):
+        if not part.strip():
+            continue
+        label, _, text = part.partition('||')
+        out.append([label.strip(), text.strip()])
+    return out or None
+
+
+# ----- Hash password -----
+# Metode & biaya hash diatur lewat PASSWORD_HASH_METHOD. Hash dihitung di pool
+# kecil (PASSWORD_HASH_WORKERS) supaya banyak login sekaligus di awal jam
+# pelajaran tidak menghabiskan semua CPU; request lain tetap dilayani.
+class PasswordHashBusy(Exception):
+    pass
+
+
+_password_pool = None
+_password_pool_lock = threading.Lock()
+
+
+def run_password_hash(fn, *args):
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is None:
+            _password_pool = ThreadPoolExecutor(
+                max_workers=app.config['PASSWORD_HASH_WORKERS'], thread_name_prefix='password')
+    future = _password_pool.submit(fn, *args)
+    try:
+        return future.result(timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+    except FutureTimeout:
+        future.cancel()
+        raise PasswordHashBusy()
+
+
+@lru_cache(maxsize=8)
+def password_hash_prefix(method):
+    # awalan hash untuk metode ini, mis. 'pbkdf2:sha256:600000' atau 'scrypt:32768:8:1'
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
 # ----- Models -----
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -47,10 +141,14 @@ class User(db.Model, UserMixin):
     scores = db.relationship('Score', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = run_password_hash(
+            generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return run_password_hash(check_password_hash, self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return self.password_hash.split('$', 1)[0] != password_hash_prefix(app.config['PASSWORD_HASH_METHOD'])
 
 
 class Material(db.Model):
@@ -60,16 +158,63 @@ class Material(db.Model):
     image_filename = db.Column(db.String(200), nullable=True)
 
 
+# Gambar materi hasil upload; nama file = '<sha256 isi>.<ext>', sama dengan
+# Material.image_filename yang memakainya (lihat store_material_image)
+class MaterialImage(db.Model):
+    filename = db.Column(db.String(80), primary_key=True)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    # thumbnail dari pool latar belakang: [{"file": "ab/ab12....w400.webp", "width": 400, "type": "image/webp"}]
+    variants = db.Column(db.JSON, nullable=False, default=list)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def url(self):
+        return url_for('media', filename=media_path(self.filename))
+
+    def srcset(self, webp=False):
+        return ', '.join(f"{url_for('media', filename=v['file'])} {v['width']}w"
+                         for v in self.variants or [] if (v['type'] == 'image/webp') == webp)
+
+    def src(self, max_width=None):
+        # thumbnail terbesar (format asli) yang tidak melebihi max_width, atau file asli
+        fallback = [v for v in self.variants or [] if v['type'] != 'image/webp'
+                    and (max_width is None or v['width'] <= max_width)]
+        if fallback:
+            return url_for('media', filename=max(fallback, key=lambda v: v['width'])['file'])
+        return self.url
+
+
+# pencarian awalan judul tanpa peka huruf besar/kecil (lihat search_prefix)
+db.Index('ix_material_title_lower', db.func.lower(Material.title))
+
+
 class Question(db.Model):
+    __table_args__ = (
+        db.Index('ix_question_qtype_id', 'qtype', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
     qtype = db.Column(db.String(20), default='mcq')  # 'mcq' or 'tf'
     # choices format e.g. "A||Pilihan A;;B||Pilihan B;;C||Pilihan C"
     choices = db.Column(db.Text, nullable=True)
+    # hasil parse `choices`, e.g. [["A", "Pilihan A"], ["B", "Pilihan B"]]
+    choice_list = db.Column(db.JSON(none_as_null=True), nullable=True)
     correct = db.Column(db.String(200), nullable=False)  # e.g. 'A' or 'True'
 
+    @validates('choices')
+    def _sync_choice_list(self, key, value):
+        # choice_list selalu ikut diperbarui saat teks pilihan diubah
+        self.choice_list = parse_choices(value)
+        return value
+
 
 class Score(db.Model):
+    __table_args__ = (
+        db.Index('ix_score_user_score', 'user_id', 'score'),
+        db.Index('ix_score_taken_at', 'taken_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
@@ -77,10 +222,1880 @@ class Score(db.Model):
     taken_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# Jumlah & total nilai per hari (tanggal lokal sekolah) untuk grafik
+# rata-rata harian di dashboard guru, diperbarui bersama setiap Score baru.
+class DailyScoreRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    score_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Satu percobaan kuis: soal yang diundi disimpan di server supaya hanya
+# soal tersebut yang ditampilkan per halaman dan dinilai saat dikirim.
+# Jawaban disimpan per soal di AttemptAnswer (autosave), jadi submit akhir
+# cukup menilai yang sudah tersimpan. Dengan QUIZ_TIME_LIMIT percobaan punya
+# batas waktu dari server (deadline_at).
+class QuizAttempt(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    question_ids = db.Column(db.Text, nullable=False)  # e.g. "3,17,42"
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deadline_at = db.Column(db.DateTime, nullable=True)  # None = tanpa batas waktu
+    submitted_at = db.Column(db.DateTime, nullable=True)
+    # hasil penilaian, untuk halaman hasil saat form dikirim ulang
+    score = db.Column(db.Integer, nullable=True)
+    correct_count = db.Column(db.Integer, nullable=True)
+    total = db.Column(db.Integer, nullable=True)
+
+    @property
+    def ids(self):
+        return [int(i) for i in self.question_ids.split(',') if i]
+
+    def remaining_seconds(self):
+        if self.deadline_at is None:
+            return None
+        return max(0, int((self.deadline_at - datetime.utcnow()).total_seconds()))
+
+    def is_expired(self):
+        # toleransi untuk autosave/submit yang dikirim tepat sebelum waktu habis
+        return self.deadline_at is not None and \
+            datetime.utcnow() > self.deadline_at + timedelta(seconds=app.config['QUIZ_DEADLINE_GRACE'])
+
+    def get_answers(self):
+        rows = db.session.query(AttemptAnswer.question_id, AttemptAnswer.answer).filter_by(attempt_id=self.id)
+        return {f'question_{qid}': answer for qid, answer in rows}
+
+    def save_answers(self, form, question_ids):
+        save_attempt_answers(self.id, form_answers(form, question_ids))
+
+
+class AttemptAnswer(db.Model):
+    attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempt.id'), primary_key=True)
+    question_id = db.Column(db.Integer, primary_key=True)
+    answer = db.Column(db.String(200), nullable=False)
+    saved_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Ringkasan nilai per murid, diperbarui setiap kali Score baru disimpan
+# (lihat record_score) supaya halaman statistik tidak perlu memindai Score.
+class StudentStats(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    last_taken_at = db.Column(db.DateTime, nullable=True)
+    level = db.Column(db.String(20), nullable=False, default='Pemula')
+
+    @property
+    def avg_score(self):
+        return int(self.score_sum / self.attempts) if self.attempts else 0
+
+
+# Log jawaban per soal, hanya ditambah (yang di-update hanya stats_batch).
+# Ditulis sekaligus untuk semua soal dalam satu submit; `score` adalah nilai
+# submit tersebut, dipakai untuk daya beda soal (lihat ItemStats).
+class Answer(db.Model):
+    __table_args__ = (
+        db.Index('ix_answer_stats_batch', 'stats_batch'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    attempt_id = db.Column(db.Integer, nullable=True)
+    question_id = db.Column(db.Integer, nullable=False)  # tanpa FK: log tetap ada walau soal dihapus
+    choice = db.Column(db.String(20), nullable=False, default='')  # jawaban ternormalisasi, '' = kosong
+    correct = db.Column(db.Boolean, nullable=False)
+    score = db.Column(db.SmallInteger, nullable=False)
+    answered_at = db.Column(db.DateTime, default=datetime.utcnow)
+    stats_batch = db.Column(db.BigInteger, nullable=True)  # None = belum masuk ItemStats
+
+
+# Agregat per soal dari log Answer, ditambah bertahap untuk baris yang
+# stats_batch-nya masih kosong (lihat refresh_item_stats). Jumlah-jumlah
+# ini cukup untuk menghitung tingkat kesukaran dan korelasi point-biserial
+# antara benar/salah dengan nilai submit tanpa membaca ulang log.
+class ItemStats(db.Model):
+    question_id = db.Column(db.Integer, primary_key=True)
+    answered = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    score_sq_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    correct_score_sum = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @property
+    def difficulty(self):
+        # proporsi benar (p): makin kecil makin sulit
+        return self.correct_count / self.answered if self.answered else None
+
+    @property
+    def discrimination(self):
+        n, x, y = self.answered, self.correct_count, self.score_sum
+        spread = (n * x - x * x) * (n * self.score_sq_sum - y * y)
+        if spread <= 0:
+            return None  # semua benar/salah atau nilai semua sama
+        return (n * self.correct_score_sum - x * y) / spread ** 0.5
+
+
+class ItemChoiceStats(db.Model):
+    question_id = db.Column(db.Integer, primary_key=True)
+    choice = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Job ekspor nilai yang dikerjakan di latar belakang (lihat ReportRunner)
+class ReportJob(db.Model):
+    __table_args__ = (
+        db.Index('ix_report_job_cache', 'cache_key', 'score_version'),
+        db.Index('ix_report_job_user_status', 'created_by', 'status'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'export'
+    params = db.Column(db.Text, nullable=False)  # JSON filter ekspor
+    cache_key = db.Column(db.String(40), nullable=False)  # sha1 dari kind + params
+    score_version = db.Column(db.Integer, nullable=False)  # Score.id terbesar saat job dibuat
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    result_file = db.Column(db.String(200), nullable=True)
+    result_rows = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    @property
+    def filters(self):
+        return json.loads(self.params)
+
+    @property
+    def state(self):
+        # job yang tidak selesai dalam REPORT_JOB_TIMEOUT (mis. server restart) dianggap gagal
+        if self.status in ('queued', 'running') and self.created_at < report_stale_before():
+            return 'failed'
+        return self.status
+
+
+# Migrasi database lama: tambah kolom choice_list lalu isi dari `choices`
+def migrate_question_choices(batch_size=1000):
+    columns = [c['name'] for c in db.inspect(db.engine).get_columns('question')]
+    if 'choice_list' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE question ADD COLUMN choice_list JSON'))
+    table = Question.__table__
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.choices)
+            .where(table.c.id > last_id, table.c.choice_list.is_(None), table.c.choices.isnot(None))
+            .order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('qid')).values(choice_list=db.bindparam('parsed')),
+            [{'qid': qid, 'parsed': parse_choices(raw)} for qid, raw in rows],
+        )
+        db.session.commit()
+        migrated += len(rows)
+        last_id = rows[-1][0]
+    return migrated
+
+
+# Migrasi database lama: kolom quiz_attempt untuk mode ujian dan hasil kuis
+QUIZ_ATTEMPT_COLUMNS = {'deadline_at': 'DATETIME', 'score': 'INTEGER', 'correct_count': 'INTEGER', 'total': 'INTEGER'}
+
+
+def migrate_quiz_attempt_columns():
+    columns = [c['name'] for c in db.inspect(db.engine).get_columns('quiz_attempt')]
+    missing = [name for name in QUIZ_ATTEMPT_COLUMNS if name not in columns]
+    if missing:
+        with db.engine.begin() as conn:
+            for name in missing:
+                conn.execute(db.text(f'ALTER TABLE quiz_attempt ADD COLUMN {name} {QUIZ_ATTEMPT_COLUMNS[name]}'))
+    if 'answers' in columns:
+        # kolom JSON lama (NOT NULL tanpa default di database), jawaban kini di AttemptAnswer
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE quiz_attempt DROP COLUMN answers'))
+
+
+@app.cli.command('migrate-choices')
+def migrate_choices_command():
+    # flask --app app migrate-choices
+    count = migrate_question_choices()
+    print(f'{count} soal dimigrasi ke choice_list.')
+
+
+# ----- Cache kunci jawaban -----
+# Kunci jawaban dikompilasi sekali menjadi {question_id: jawaban_ternormalisasi}
+# dan dipakai ulang oleh setiap submit kuis. Versi dinaikkan setiap kali soal
+# diubah guru, sehingga cache lama otomatis dibangun ulang. Versi tag
+# 'question' di page_cache juga dicek supaya perubahan soal di worker lain
+# (lewat CACHE_BACKEND) ikut terlihat.
+_answer_key_lock = threading.Lock()
+_answer_key = {'version': 0, 'key': None, 'tag_version': None}
+
+
+def normalize_answer(value):
+    return (value or '').strip().lower()
+
+
+def invalidate_answer_key():
+    with _answer_key_lock:
+        _answer_key['version'] += 1
+        _answer_key['key'] = None
+
+
+def get_answer_key():
+    tag_version = page_cache.tag_state('question')[0]
+    key = _answer_key['key']
+    if key is not None and _answer_key['tag_version'] == tag_version:
+        return key
+    version = _answer_key['version']
+    rows = db.session.query(Question.id, Question.correct).all()
+    key = {qid: normalize_answer(correct) for qid, correct in rows}
+    with _answer_key_lock:
+        # jangan simpan hasil kalau soal berubah selama kita membangun kunci
+        if _answer_key['version'] == version:
+            _answer_key['key'] = key
+            _answer_key['tag_version'] = tag_version
+    return key
+
+
+def grade_answers(answer_key, form, question_ids=None, graded=None):
+    # Menilai seluruh form dalam satu putaran tanpa akses ORM.
+    # question_ids membatasi penilaian ke soal yang diundi untuk percobaan ini.
+    # Jika graded diberikan (list), hasil per soal ditambahkan sebagai
+    # (question_id, jawaban, benar) untuk log Answer.
+    if question_ids is None:
+        question_ids = answer_key
+    correct_count = 0
+    total = 0
+    for qid in question_ids:
+        expected = answer_key.get(qid)
+        if expected is None:
+            continue  # soal sudah dihapus guru
+        total += 1
+        given = normalize_answer(form.get(f'question_{qid}'))
+        ok = bool(given) and given == expected
+        if ok:
+            correct_count += 1
+        if graded is not None:
+            graded.append((qid, given, ok))
+    return correct_count, total
+
+
+# ----- Sesi kuis -----
+# Soal diundi dari id di kunci jawaban yang sudah ada di memori, jadi tidak
+# perlu ORDER BY RANDOM() atau memuat seluruh bank soal.
+def start_quiz_attempt(user_id):
+    ids = list(get_answer_key())
+    count = min(app.config['QUIZ_QUESTION_COUNT'] or len(ids), len(ids))
+    now = datetime.utcnow()
+    limit = app.config['QUIZ_TIME_LIMIT']
+    attempt = QuizAttempt(user_id=user_id, question_ids=','.join(str(i) for i in random.sample(ids, count)),
+                          started_at=now, deadline_at=now + timedelta(seconds=limit) if limit else None)
+    db.session.add(attempt)
+    db.session.commit()
+    session['quiz_attempt_id'] = attempt.id
+    return attempt
+
+
+def current_quiz_attempt(user_id):
+    attempt_id = session.get('quiz_attempt_id')
+    if attempt_id is None:
+        return None
+    attempt = db.session.get(QuizAttempt, attempt_id)
+    if attempt is None or attempt.user_id != user_id or attempt.submitted_at is not None:
+        session.pop('quiz_attempt_id', None)
+        return None
+    return attempt
+
+
+def posted_quiz_attempt(user_id, attempt_id):
+    # percobaan milik murid ini (id dari field tersembunyi form kuis / URL hasil)
+    attempt = db.session.get(QuizAttempt, attempt_id) if attempt_id else None
+    if attempt is None or attempt.user_id != user_id:
+        return None
+    return attempt
+
+
+def form_answers(form, question_ids):
+    # {question_id: jawaban} dari field form question_<id> yang diisi
+    return {qid: form[f'question_{qid}'] for qid in question_ids if form.get(f'question_{qid}')}
+
+
+def save_attempt_answers(attempt_id, answers):
+    # Upsert murah per soal: UPDATE berdasarkan primary key, INSERT jika
+    # belum ada. Pemanggil yang melakukan commit (IntegrityError = autosave
+    # lain untuk soal yang sama baru saja masuk, cukup diulang).
+    now = datetime.utcnow()
+    new = []
+    for qid, answer in answers.items():
+        updated = db.session.query(AttemptAnswer).filter_by(attempt_id=attempt_id, question_id=qid).update(
+            {AttemptAnswer.answer: answer, AttemptAnswer.saved_at: now}, synchronize_session=False)
+        if not updated:
+            new.append({'attempt_id': attempt_id, 'question_id': qid, 'answer': answer, 'saved_at': now})
+    if new:
+        db.session.execute(AttemptAnswer.__table__.insert(), new)
+
+
+def finalize_attempt(attempt, username, answers=None):
+    # Nilai percobaan dari jawaban yang tersimpan (+ `answers` dari halaman
+    # terakhir selama waktu belum habis). Mengembalikan (nilai, benar, total),
+    # atau None jika percobaan sudah dinilai (submit ganda / sudah kedaluwarsa).
+    stored = attempt.get_answers()
+    if answers and not attempt.is_expired():
+        stored.update((f'question_{qid}', value) for qid, value in answers.items())
+    graded = []
+    correct_count, total = grade_answers(get_answer_key(), stored, attempt.ids, graded)
+    score = int((correct_count / total) * 100) if total > 0 else 0
+    claimed = db.session.query(QuizAttempt).filter(
+        QuizAttempt.id == attempt.id, QuizAttempt.submitted_at.is_(None)
+    ).update({QuizAttempt.submitted_at: datetime.utcnow(), QuizAttempt.score: score,
+              QuizAttempt.correct_count: correct_count, QuizAttempt.total: total}, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return None
+    score_writer.submit(attempt.user_id, username, score, total, attempt.id, graded)
+    return score, correct_count, total
+
+
+@app.cli.command('finalize-attempts')
+def finalize_attempts_command():
+    # flask --app app finalize-attempts
+    # nilai percobaan yang waktunya habis tanpa submit (mis. koneksi murid putus)
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['QUIZ_DEADLINE_GRACE'])
+    rows = db.session.query(QuizAttempt, User.username).join(User, User.id == QuizAttempt.user_id).filter(
+        QuizAttempt.submitted_at.is_(None), QuizAttempt.deadline_at < cutoff).all()
+    count = sum(1 for attempt, username in rows if finalize_attempt(attempt, username) is not None)
+    print(f'{count} percobaan dinilai.')
+
+
+def questions_by_id(question_ids):
+    # Data soal disimpan di page_cache (tag 'question') sebagai dict biasa,
+    # jadi halaman kuis berikutnya tidak perlu memuat ulang dari database.
+    if not question_ids:
+        return []
+    found = page_cache.get_many('question', question_ids)
+    missing = [qid for qid in question_ids if qid not in found]
+    if missing:
+        for q in Question.query.filter(Question.id.in_(missing)).all():
+            found[q.id] = question_cache_entry(q)
+            page_cache.set('question', q.id, found[q.id])
+    return [found[qid] for qid in question_ids if qid in found]
+
+
+def question_cache_entry(q):
+    return {'id': q.id, 'text': q.text, 'qtype': q.qtype, 'choice_list': q.choice_list}
+
+
+# ----- Agregasi nilai per murid -----
+# Satu query GROUP BY untuk jumlah kuis, rata-rata, nilai terbaik dan tanggal
+# terakhir tiap murid (menggantikan query Score per murid / N+1).
+def student_score_query(user_id=None, role='murid', username=None, start=None, end=None, until_id=None):
+    if start is None and end is None and until_id is None:
+        # tanpa filter tanggal cukup baca tabel ringkasan StudentStats
+        query = db.session.query(
+            User.id,
+            User.username,
+            db.func.coalesce(StudentStats.attempts, 0),
+            StudentStats.score_sum * 1.0 / db.func.nullif(StudentStats.attempts, 0),
+            StudentStats.best_score,
+            StudentStats.last_taken_at,
+        ).outerjoin(StudentStats, StudentStats.user_id == User.id)
+    else:
+        # filter tanggal ada di kondisi join supaya murid tanpa nilai tetap muncul
+        join_on = [Score.user_id == User.id]
+        if start is not None:
+            join_on.append(Score.taken_at >= start)
+        if end is not None:
+            join_on.append(Score.taken_at < end)
+        if until_id is not None:
+            join_on.append(Score.id <= until_id)
+        query = db.session.query(
+            User.id,
+            User.username,
+            db.func.count(Score.id),
+            db.func.avg(Score.score),
+            db.func.max(Score.score),
+            db.func.max(Score.taken_at),
+        ).outerjoin(Score, db.and_(*join_on)).group_by(User.id, User.username)
+    if user_id is not None:
+        query = query.filter(User.id == user_id)
+    elif role is not None:
+        query = query.filter(User.role == role)
+    if username is not None:
+        query = query.filter(User.username == username)
+    return query.order_by(User.id)
+
+
+def summary_row(row):
+    uid, username, total_quiz, avg, best, last_taken = row
+    return {
+        'user_id': uid,
+        'username': username,
+        'total_quiz': total_quiz,
+        'avg_score': int(avg) if avg is not None else 0,
+        'best_score': best or 0,
+        'last_taken': last_taken,
+    }
+
+
+def student_score_summary(**filters):
+    return [summary_row(row) for row in student_score_query(**filters).all()]
+
+
+def user_score_stats(user_id):
+    stats = db.session.get(StudentStats, user_id)
+    if stats is None:
+        return {'total_quiz': 0, 'avg_score': 0, 'best_score': 0,
+                'last_taken': None, 'level': get_level(0)}
+    return {'total_quiz': stats.attempts, 'avg_score': stats.avg_score,
+            'best_score': stats.best_score, 'last_taken': stats.last_taken_at,
+            'level': stats.level}
+
+
+# Simpan Score baru dan perbarui StudentStats dalam transaksi yang sama.
+# Pemanggil yang melakukan commit.
+def record_score(user_id, score, total, taken_at=None):
+    taken_at = taken_at or datetime.utcnow()
+    s = Score(user_id=user_id, score=score, total=total, taken_at=taken_at)
+    db.session.add(s)
+    # UPDATE atomik supaya submit bersamaan tidak saling menimpa hitungan
+    updated = db.session.query(StudentStats).filter_by(user_id=user_id).update({
+        StudentStats.attempts: StudentStats.attempts + 1,
+        StudentStats.score_sum: StudentStats.score_sum + score,
+        StudentStats.best_score: db.case((StudentStats.best_score < score, score),
+                                         else_=StudentStats.best_score),
+        StudentStats.last_taken_at: taken_at,
+    }, synchronize_session=False)
+    if updated:
+        stats = db.session.get(StudentStats, user_id, populate_existing=True)
+    else:
+        stats = StudentStats(user_id=user_id, attempts=1, score_sum=score,
+                             best_score=score, last_taken_at=taken_at)
+        db.session.add(stats)
+    stats.level = get_level(stats.avg_score)
+
+    day = local_date(taken_at)
+    updated = db.session.query(DailyScoreRollup).filter_by(day=day).update({
+        DailyScoreRollup.score_count: DailyScoreRollup.score_count + 1,
+        DailyScoreRollup.score_sum: DailyScoreRollup.score_sum + score,
+    }, synchronize_session=False)
+    if not updated:
+        db.session.add(DailyScoreRollup(day=day, score_count=1, score_sum=score))
+    return s
+
+
+def local_date(utc_dt):
+    return (utc_dt + timedelta(hours=app.config['LOCAL_UTC_OFFSET'])).date()
+
+
+def rebuild_daily_rollup():
+    totals = {}
+    for taken_at, score in db.session.query(Score.taken_at, Score.score).yield_per(10000):
+        day = local_date(taken_at)
+        count, total = totals.get(day, (0, 0))
+        totals[day] = (count + 1, total + score)
+    db.session.query(DailyScoreRollup).delete(synchronize_session=False)
+    if totals:
+        db.session.execute(DailyScoreRollup.__table__.insert(), [
+            {'day': day, 'score_count': count, 'score_sum': total}
+            for day, (count, total) in totals.items()
+        ])
+    db.session.commit()
+    return len(totals)
+
+
+@app.cli.command('rebuild-daily')
+def rebuild_daily_command():
+    # flask --app app rebuild-daily
+    count = rebuild_daily_rollup()
+    print(f'DailyScoreRollup dibangun ulang untuk {count} hari.')
+
+
+def rebuild_student_stats():
+    rows = db.session.query(
+        Score.user_id,
+        db.func.count(Score.id),
+        db.func.sum(Score.score),
+        db.func.max(Score.score),
+        db.func.max(Score.taken_at),
+    ).group_by(Score.user_id).all()
+    db.session.query(StudentStats).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(StudentStats.__table__.insert(), [{
+            'user_id': uid,
+            'attempts': attempts,
+            'score_sum': score_sum,
+            'best_score': best,
+            'last_taken_at': last_taken,
+            'level': get_level(int(score_sum / attempts)),
+        } for uid, attempts, score_sum, best, last_taken in rows])
+    db.session.commit()
+    leaderboard_cache.invalidate()
+    return len(rows)
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    # flask --app app rebuild-stats
+    count = rebuild_student_stats()
+    print(f'StudentStats dibangun ulang untuk {count} murid.')
+
+
+# ----- Analisis butir soal -----
+# Submit kuis hanya menambah baris Answer. Agregat per soal (ItemStats,
+# ItemChoiceStats) diperbarui oleh penulis nilai setelah Answer di-commit
+# (per batch pada mode 'batch'): baris yang belum dihitung diklaim dengan
+# satu UPDATE stats_batch, lalu dua query GROUP BY atas klaim itu ditambahkan
+# ke agregat lama. Jadi biayanya sebanding dengan jawaban baru, bukan seluruh
+# log; laporan guru hanya membaca. Klaim per baris (bukan rentang id) karena
+# id dari sequence PostgreSQL bisa di-commit tidak berurutan.
+_item_stats_lock = threading.Lock()
+
+
+def add_totals(table, key, rows):
+    # Tambahkan selisih di rows ke tabel agregat: UPDATE x = x + :selisih
+    # (executemany) untuk kunci yang sudah ada, INSERT untuk yang belum.
+    if not rows:
+        return
+    key_cols = [table.c[k] for k in key]
+    known = set(db.session.execute(db.select(*key_cols).where(key_cols[0].in_({r[key[0]] for r in rows}))).tuples())
+    existing, new = [], []
+    for r in rows:
+        (existing if tuple(r[k] for k in key) in known else new).append(r)
+    if existing:
+        deltas = [c for c in rows[0] if c not in key]
+        stmt = table.update() \
+            .where(*[table.c[k] == db.bindparam('key_' + k) for k in key]) \
+            .values({c: table.c[c] + db.bindparam('delta_' + c) for c in deltas})
+        db.session.execute(stmt, [{('key_' if c in key else 'delta_') + c: v for c, v in r.items()} for r in existing])
+    if new:
+        db.session.execute(table.insert(), new)
+
+
+def refresh_item_stats():
+    with _item_stats_lock:
+        # klaim semua baris yang sudah di-commit dan belum dihitung dengan nomor
+        # batch acak; proses lain tidak bisa mengklaim baris yang sama, dan
+        # baris yang di-commit belakangan tetap kosong sampai pembaruan berikutnya
+        batch = random.SystemRandom().getrandbits(62)
+        claimed = db.session.query(Answer).filter(Answer.stats_batch.is_(None)).update(
+            {Answer.stats_batch: batch}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return 0
+
+        new_rows = Answer.stats_batch == batch
+        correct = db.case((Answer.correct, 1), else_=0)
+        totals = db.session.query(
+            Answer.question_id,
+            db.func.count(),
+            db.func.sum(correct),
+            db.func.sum(Answer.score),
+            db.func.sum(Answer.score * Answer.score),
+            db.func.sum(correct * Answer.score),
+        ).filter(new_rows).group_by(Answer.question_id).all()
+        choices = db.session.query(Answer.question_id, Answer.choice, db.func.count()) \
+            .filter(new_rows).group_by(Answer.question_id, Answer.choice).all()
+
+        add_totals(ItemStats.__table__, ['question_id'], [{
+            'question_id': qid, 'answered': answered, 'correct_count': correct_count, 'score_sum': score_sum,
+            'score_sq_sum': score_sq_sum, 'correct_score_sum': correct_score_sum,
+        } for qid, answered, correct_count, score_sum, score_sq_sum, correct_score_sum in totals])
+        add_totals(ItemChoiceStats.__table__, ['question_id', 'choice'], [
+            {'question_id': qid, 'choice': choice, 'count': count} for qid, choice, count in choices])
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # soal baru dimasukkan bersamaan oleh proses lain; klaim ikut
+            # dibatalkan, jadi baris-baris ini dihitung pada pembaruan berikutnya
+            db.session.rollback()
+            return 0
+        return len(totals)
+
+
+def rebuild_item_stats():
+    with _item_stats_lock:
+        for model in (ItemStats, ItemChoiceStats):
+            db.session.query(model).delete(synchronize_session=False)
+        db.session.query(Answer).filter(Answer.stats_batch.isnot(None)).update(
+            {Answer.stats_batch: None}, synchronize_session=False)
+        db.session.commit()
+    return refresh_item_stats()
+
+
+# Migrasi database lama: ItemStats dulu memakai cursor id (item_stats_cursor);
+# agregat dibangun ulang setelah kolom stats_batch ditambahkan
+def migrate_answer_stats_batch():
+    columns = [c['name'] for c in db.inspect(db.engine).get_columns('answer')]
+    if 'stats_batch' in columns:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(db.text('ALTER TABLE answer ADD COLUMN stats_batch BIGINT'))
+        conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_answer_stats_batch ON answer (stats_batch)'))
+        conn.execute(db.text('DROP TABLE IF EXISTS item_stats_cursor'))
+    rebuild_item_stats()
+
+
+def update_item_stats():
+    # Gagal di sini tidak membatalkan nilai yang sudah tersimpan; rentang
+    # Answer yang sama diambil lagi pada pembaruan berikutnya.
+    try:
+        refresh_item_stats()
+    except OperationalError:
+        db.session.rollback()
+        app.logger.warning('ItemStats belum diperbarui (database sibuk)')
+
+
+@app.cli.command('rebuild-item-stats')
+def rebuild_item_stats_command():
+    # flask --app app rebuild-item-stats
+    count = rebuild_item_stats()
+    print(f'ItemStats dibangun ulang untuk {count} soal.')
+
+
+CHOICE_LABELS = {'': 'Kosong', 'true': 'Benar', 'false': 'Salah'}
+
+
+def item_analysis(limit=None):
+    # soal tersulit dulu, dengan sebaran jawaban per pilihan (hanya membaca)
+    p = ItemStats.correct_count * 1.0 / ItemStats.answered
+    rows = db.session.query(ItemStats, Question).join(Question, Question.id == ItemStats.question_id) \
+        .filter(ItemStats.answered > 0).order_by(p, Question.id).limit(limit or app.config['ITEM_ANALYSIS_LIMIT']).all()
+    spread = {}
+    for c in ItemChoiceStats.query.filter(ItemChoiceStats.question_id.in_([q.id for _, q in rows])) \
+            .order_by(ItemChoiceStats.question_id, ItemChoiceStats.choice):
+        spread.setdefault(c.question_id, []).append((c.choice, c.count))
+    expected_key = get_answer_key()
+    return [{
+        'question_id': q.id,
+        'text': q.text,
+        'answered': s.answered,
+        'difficulty': s.difficulty,
+        'discrimination': s.discrimination,
+        # pilihan salah yang sering dipilih = pengecoh yang bekerja (atau kunci yang keliru)
+        'choices': [{'choice': CHOICE_LABELS.get(choice, choice.upper()), 'count': count,
+                     'share': count / s.answered, 'correct': choice == expected_key.get(q.id)}
+                    for choice, count in spread.get(q.id, [])],
+    } for s, q in rows]
+
+
+# ----- Paginasi keyset -----
+# Halaman berikutnya dicari dengan `id > id_terakhir` (bukan OFFSET), jadi
+# waktu per halaman tetap sama berapa pun besar tabelnya. Cursor berisi id
+# batas halaman dan arahnya, dikodekan base64 supaya aman di URL.
+def encode_cursor(last_id, direction):
+    raw = json.dumps({'id': last_id, 'dir': direction}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return {'id': int(data['id']), 'dir': 'prev' if data.get('dir') == 'prev' else 'next'}
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def page_size_arg():
+    size = request.args.get('size', app.config['ADMIN_PAGE_SIZE'], type=int)
+    return min(max(size or 1, 1), app.config['ADMIN_PAGE_SIZE_MAX'])
+
+
+def keyset_page(query, id_col, cursor, size):
+    token = decode_cursor(cursor)
+    if token is not None and token['dir'] == 'prev':
+        rows = query.filter(id_col < token['id']).order_by(id_col.desc()).limit(size + 1).all()
+        has_more = len(rows) > size
+        rows = rows[:size][::-1]
+        next_cursor = encode_cursor(rows[-1].id, 'next') if rows else None
+        prev_cursor = encode_cursor(rows[0].id, 'prev') if has_more else None
+    else:
+        if token is not None:
+            query = query.filter(id_col > token['id'])
+        rows = query.order_by(id_col).limit(size + 1).all()
+        has_more = len(rows) > size
+        rows = rows[:size]
+        next_cursor = encode_cursor(rows[-1].id, 'next') if has_more else None
+        prev_cursor = encode_cursor(rows[0].id, 'prev') if token is not None and rows else None
+    return {'items': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+
+def search_prefix(column, term):
+    # lower(kolom) >= 'abc' AND lower(kolom) < 'abd' memakai index ekspresi
+    term = term.strip().lower()
+    upper = term[:-1] + chr(ord(term[-1]) + 1)
+    return db.and_(db.func.lower(column) >= term, db.func.lower(column) < upper)
+
+
+def question_list_page():
+    query = db.session.query(Question.id, Question.text, Question.qtype, Question.choice_list, Question.correct)
+    qtype = request.args.get('qtype', '').strip()
+    if qtype:
+        query = query.filter(Question.qtype == qtype)
+    return keyset_page(query, Question.id, request.args.get('cursor'), page_size_arg())
+
+
+def material_list_page():
+    query = db.session.query(Material.id, Material.title, Material.image_filename)
+    term = request.args.get('q', '').strip()
+    if term:
+        query = query.filter(search_prefix(Material.title, term))
+    return keyset_page(query, Material.id, request.args.get('cursor'), page_size_arg())
+
+
+# ----- Pencarian teks penuh (FTS5) -----
+# Index FTS5 terpisah untuk materi dan soal dengan rowid = id baris aslinya,
+# jadi sinkronisasi cukup hapus/isi ulang satu rowid. Tokenizer unicode61
+# membuang diakritik; kolom `stems` berisi kandidat kata dasar bahasa
+# Indonesia (imbuhan dibuang) supaya "menyaring" ditemukan dengan "saring".
+SEARCH_TABLES = {
+    'material_fts': 'title, body, stems',
+    'question_fts': 'body, stems',
+}
+SEARCH_TOKENIZER = 'unicode61 remove_diacritics 2'
+SEARCH_INDEX_BATCH = 2000
+ID_PARTICLES = ('lah', 'kah', 'tah', 'pun')
+ID_POSSESSIVES = ('nya', 'ku', 'mu')
+ID_SUFFIXES = ('kan', 'an', 'i')
+# awalan beserta huruf awal kata dasar yang luluh (meny+apu -> sapu)
+ID_PREFIXES = (
+    ('meny', 's'), ('meng', 'k'), ('mem', 'p'), ('men', 't'), ('me', ''),
+    ('peny', 's'), ('peng', 'k'), ('pem', 'p'), ('pen', 't'), ('per', ''), ('pe', ''),
+    ('ber', ''), ('be', ''), ('ter', ''), ('di', ''), ('ke', ''), ('se', ''),
+)
+SEARCH_WORD = re.compile(r'\w+')
+_search_ready = False
+
+
+@lru_cache(maxsize=50000)
+def indonesian_stems(word):
+    # stemmer ringan: kandidat kata dasar, bukan analisis morfologi lengkap
+    base = word
+    for group in (ID_PARTICLES, ID_POSSESSIVES):
+        for suffix in group:
+            if base.endswith(suffix) and len(base) - len(suffix) >= 4:
+                base = base[:-len(suffix)]
+                break
+    stems = {word, base}
+    for suffix in ID_SUFFIXES:
+        if base.endswith(suffix) and len(base) - len(suffix) >= 4:
+            stems.add(base[:-len(suffix)])
+            break
+    for stem in list(stems):
+        for prefix, initial in ID_PREFIXES:
+            if stem.startswith(prefix) and len(stem) - len(prefix) >= 3:
+                rest = stem[len(prefix):]
+                stems.add(rest)
+                if initial and rest[0] in 'aiueo':
+                    stems.add(initial + rest)
+                break
+    return frozenset(stem for stem in stems if len(stem) >= 3)
+
+
+def stems_column(*texts):
+    words = set(SEARCH_WORD.findall(' '.join(t or '' for t in texts).lower()))
+    stems = set()
+    for word in words:
+        stems |= indonesian_stems(word)
+    return ' '.join(sorted(stems - words))
+
+
+def search_index_ready(connection):
+    # hasil positif disimpan; jika belum ada, dicek lagi (db_init bisa membuatnya belakangan)
+    global _search_ready
+    if not _search_ready and connection.dialect.name == 'sqlite':
+        found = connection.execute(db.text(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN ('material_fts', 'question_fts')"
+        )).scalar()
+        _search_ready = found == len(SEARCH_TABLES)
+    return _search_ready
+
+
+def ensure_search_index():
+    # False jika bukan SQLite atau SQLite dikompilasi tanpa FTS5
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with db.engine.begin() as conn:
+            for table, columns in SEARCH_TABLES.items():
+                conn.execute(db.text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({columns}, tokenize = '{SEARCH_TOKENIZER}')"))
+    except OperationalError:
+        return False
+    return True
+
+
+def material_index_row(id, title, text):
+    return {'id': id, 'title': title, 'body': text, 'stems': stems_column(title, text)}
+
+
+def question_index_row(id, text):
+    return {'id': id, 'body': text, 'stems': stems_column(text)}
+
+
+def index_materials(connection, rows):
+    if rows:
+        connection.execute(db.text('DELETE FROM material_fts WHERE rowid = :id'), rows)
+        connection.execute(db.text(
+            'INSERT INTO material_fts (rowid, title, body, stems) VALUES (:id, :title, :body, :stems)'), rows)
+
+
+def index_questions(connection, rows):
+    if rows:
+        connection.execute(db.text('DELETE FROM question_fts WHERE rowid = :id'), rows)
+        connection.execute(db.text(
+            'INSERT INTO question_fts (rowid, body, stems) VALUES (:id, :body, :stems)'), rows)
+
+
+def rebuild_search_index():
+    ensure_search_index()
+    for table in SEARCH_TABLES:
+        db.session.execute(db.text(f'DELETE FROM {table}'))
+    for query, make_row, index in (
+        (db.session.query(Material.id, Material.title, Material.text), material_index_row, index_materials),
+        (db.session.query(Question.id, Question.text), question_index_row, index_questions),
+    ):
+        batch = []
+        for row in query.yield_per(SEARCH_INDEX_BATCH):
+            batch.append(make_row(*row))
+            if len(batch) >= SEARCH_INDEX_BATCH:
+                index(db.session.connection(), batch)
+                batch = []
+        index(db.session.connection(), batch)
+    db.session.commit()
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    # flask --app app rebuild-search
+    if not ensure_search_index():
+        raise click.ClickException('SQLite ini tidak mendukung FTS5')
+    rebuild_search_index()
+    click.echo('Index pencarian dibangun ulang.')
+
+
+# sinkronisasi otomatis untuk perubahan lewat ORM (route CRUD materi & soal)
+@event.listens_for(Material, 'after_insert')
+@event.listens_for(Material, 'after_update')
+def _index_material(mapper, connection, target):
+    if search_index_ready(connection):
+        index_materials(connection, [material_index_row(target.id, target.title, target.text)])
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+def _index_question(mapper, connection, target):
+    if search_index_ready(connection):
+        index_questions(connection, [question_index_row(target.id, target.text)])
+
+
+@event.listens_for(Material, 'after_delete')
+def _unindex_material(mapper, connection, target):
+    if search_index_ready(connection):
+        connection.execute(db.text('DELETE FROM material_fts WHERE rowid = :id'), {'id': target.id})
+
+
+@event.listens_for(Question, 'after_delete')
+def _unindex_question(mapper, connection, target):
+    if search_index_ready(connection):
+        connection.execute(db.text('DELETE FROM question_fts WHERE rowid = :id'), {'id': target.id})
+
+
+def search_match_query(q):
+    # setiap kata: awalan kata di semua kolom ATAU salah satu kandidat kata dasarnya
+    clauses = []
+    for word in SEARCH_WORD.findall(q.lower())[:8]:
+        options = [f'"{word}"*'] + [f'stems:"{stem}"' for stem in sorted(indonesian_stems(word))]
+        clauses.append('(' + ' OR '.join(options) + ')')
+    return ' AND '.join(clauses)
+
+
+def query_stems(q):
+    stems = set()
+    for word in SEARCH_WORD.findall(q.lower())[:8]:
+        stems |= indonesian_stems(word)
+    return stems
+
+
+def highlight_snippet(raw, stems):
+    # kata yang cocok lewat kata dasar tidak ditandai FTS5, jadi ditandai di sini;
+    # penanda \x02/\x03 lalu diganti <mark> setelah teks di-escape
+    def mark(match):
+        word = match.group(0)
+        if word.startswith('\x02') or not indonesian_stems(word.lower()) & stems:
+            return word
+        return f'\x02{word}\x03'
+    raw = re.sub(r'\x02.*?\x03|\w+', mark, raw or '')
+    html = str(Markup.escape(raw))
+    return Markup(html.replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+
+def search_materials(q, limit):
+    match = search_match_query(q)
+    if not match:
+        return []
+    if not search_index_ready(db.session.connection()):
+        return search_like(Material, q, limit)
+    rows = db.session.execute(db.text(
+        "SELECT rowid, highlight(material_fts, 0, char(2), char(3)),"
+        " snippet(material_fts, 1, char(2), char(3), '…', 16)"
+        " FROM material_fts WHERE material_fts MATCH :match"
+        " ORDER BY bm25(material_fts, 10.0, 1.0, 0.5) LIMIT :limit"),
+        {'match': match, 'limit': limit})
+    stems = query_stems(q)
+    return [{'id': id, 'title': highlight_snippet(title, stems), 'snippet': highlight_snippet(snippet, stems)}
+            for id, title, snippet in rows]
+
+
+def search_questions(q, limit):
+    match = search_match_query(q)
+    if not match:
+        return []
+    if not search_index_ready(db.session.connection()):
+        return search_like(Question, q, limit)
+    rows = db.session.execute(db.text(
+        "SELECT rowid, snippet(question_fts, 0, char(2), char(3), '…', 24)"
+        " FROM question_fts WHERE question_fts MATCH :match"
+        " ORDER BY bm25(question_fts, 1.0, 0.5) LIMIT :limit"),
+        {'match': match, 'limit': limit})
+    stems = query_stems(q)
+    return [{'id': id, 'snippet': highlight_snippet(snippet, stems)} for id, snippet in rows]
+
+
+def like_snippet(text, words, size=200):
+    # potongan teks di sekitar kata pertama yang cocok, seperti snippet() FTS5
+    text = text or ''
+    lower = text.lower()
+    first = min((i for i in (lower.find(word) for word in words) if i >= 0), default=0)
+    start = max(0, first - size // 4)
+    return ('…' if start else '') + text[start:start + size] + ('…' if start + size < len(text) else '')
+
+
+def search_like(model, q, limit):
+    # cadangan tanpa FTS5 (mis. database selain SQLite): tanpa peringkat,
+    # kolom yang dicari & penanda <mark> sama dengan index FTS5
+    words = SEARCH_WORD.findall(q.lower())[:8]
+    stems = query_stems(q)
+    if model is Material:
+        query = model.query.filter(*[db.or_(Material.title.ilike(f'%{word}%'), Material.text.ilike(f'%{word}%'))
+                                     for word in words])
+        return [{'id': m.id, 'title': highlight_snippet(m.title, stems),
+                 'snippet': highlight_snippet(like_snippet(m.text, words), stems)} for m in query.limit(limit)]
+    query = model.query.filter(*[model.text.ilike(f'%{word}%') for word in words])
+    return [{'id': item.id, 'snippet': highlight_snippet(like_snippet(item.text, words), stems)}
+            for item in query.limit(limit)]
+
+
+# ----- Leaderboard -----
+# Peringkat disimpan di memori per periode sebagai daftar terurut
+# (-skor_terbaik, user_id), sehingga top-N dan "peringkat saya" cukup
+# memakai slicing/bisect tanpa GROUP BY ke tabel Score.
+LEADERBOARD_PERIODS = {
+    'all': 'Sepanjang Masa',
+    'week': 'Minggu Ini',
+    'today': 'Hari Ini',
+}
+
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {}
+
+    def _period_start(self, period, now):
+        if period == 'all':
+            return None
+        offset = timedelta(hours=app.config['LOCAL_UTC_OFFSET'])
+        start = datetime.combine(local_date(now), datetime.min.time())
+        if period == 'week':
+            start -= timedelta(days=start.weekday())
+        return start - offset
+
+    def _load(self, since):
+        if since is None:
+            query = db.session.query(User.id, User.username, StudentStats.best_score).join(
+                StudentStats, StudentStats.user_id == User.id)
+        else:
+            best = db.session.query(
+                Score.user_id, db.func.max(Score.score).label('best_score')
+            ).filter(Score.taken_at >= since).group_by(Score.user_id).subquery()
+            query = db.session.query(User.id, User.username, best.c.best_score).join(
+                best, best.c.user_id == User.id)
+        board = {'since': since, 'built_at': datetime.utcnow(), 'bests': {}, 'names': {}, 'ranked': []}
+        for uid, username, best_score in query.all():
+            board['bests'][uid] = best_score
+            board['names'][uid] = username
+            board['ranked'].append((-best_score, uid))
+        board['ranked'].sort()
+        return board
+
+    def _board(self, period):
+        now = datetime.utcnow()
+        since = self._period_start(period, now)
+        ttl = timedelta(seconds=app.config['LEADERBOARD_TTL'])
+        board = self._boards.get(period)
+        if board is None or board['since'] != since or now - board['built_at'] > ttl:
+            board = self._load(since)
+            with self._lock:
+                self._boards[period] = board
+        return board
+
+    def top(self, period='all', limit=None):
+        board = self._board(period)
+        limit = limit or app.config['LEADERBOARD_SIZE']
+        with self._lock:
+            return [(board['names'][uid], -neg) for neg, uid in board['ranked'][:limit]]
+
+    def rank_of(self, user_id, period='all'):
+        # Peringkat = jumlah pengguna dengan skor terbaik lebih tinggi + 1
+        board = self._board(period)
+        with self._lock:
+            best = board['bests'].get(user_id)
+            if best is None:
+                return None
+            return bisect_left(board['ranked'], (-best, 0)) + 1, best, len(board['ranked'])
+
+    def record(self, user_id, username, score, taken_at):
+        # Perbarui papan yang sudah ada tanpa membangunnya ulang
+        with self._lock:
+            for board in self._boards.values():
+                if board['since'] is not None and taken_at < board['since']:
+                    continue
+                old = board['bests'].get(user_id)
+                if old is not None:
+                    if score <= old:
+                        continue
+                    del board['ranked'][bisect_left(board['ranked'], (-old, user_id))]
+                board['bests'][user_id] = score
+                board['names'][user_id] = username
+                insort(board['ranked'], (-score, user_id))
+
+    def invalidate(self):
+        with self._lock:
+            self._boards.clear()
+
+
+leaderboard_cache = Leaderboard()
+
+
+# ----- Antrian penulisan nilai -----
+# Nilai yang sudah dihitung dimasukkan ke antrian lalu worker latar belakang
+# menyimpannya per batch dalam satu transaksi. Request menunggu sampai
+# batch-nya di-commit, jadi nilai tetap tahan lama, tapi SQLite hanya melihat
+# satu penulis alih-alih puluhan commit yang saling berebut lock.
+def save_quiz_result(user_id, score, total, attempt_id=None, taken_at=None, graded=None):
+    taken_at = taken_at or datetime.utcnow()
+    s = record_score(user_id, score, total, taken_at)
+    if attempt_id is not None:
+        db.session.query(QuizAttempt).filter_by(id=attempt_id).update(
+            {QuizAttempt.submitted_at: taken_at}, synchronize_session=False)
+    if graded:
+        db.session.execute(Answer.__table__.insert(), answer_log_rows(user_id, score, attempt_id, taken_at, graded))
+    return s
+
+
+def answer_log_rows(user_id, score, attempt_id, taken_at, graded):
+    return [{'user_id': user_id, 'attempt_id': attempt_id, 'question_id': qid, 'choice': given[:20],
+             'correct': ok, 'score': score, 'answered_at': taken_at} for qid, given, ok in graded]
+
+
+class PendingScore:
+    def __init__(self, user_id, username, score, total, attempt_id, taken_at, graded=None):
+        self.user_id = user_id
+        self.username = username
+        self.score = score
+        self.total = total
+        self.attempt_id = attempt_id
+        self.taken_at = taken_at
+        self.graded = graded
+        self.done = threading.Event()
+        self.error = None
+        self.owner = None  # 'writer' atau 'request': siapa yang menulis nilai ini
+        self._owner_lock = threading.Lock()
+
+    def claim(self, owner):
+        # hanya satu pihak yang boleh menulis: worker batch atau request yang kehabisan waktu
+        with self._owner_lock:
+            if self.owner is None:
+                self.owner = owner
+            return self.owner == owner
+
+
+class ScoreWriter:
+    _STOP = object()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._queue = queue.Queue(maxsize=app.config['SCORE_QUEUE_SIZE'])
+                self._thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def submit(self, user_id, username, score, total, attempt_id=None, graded=None):
+        item = PendingScore(user_id, username, score, total, attempt_id, datetime.utcnow(), graded)
+        if app.config['SCORE_WRITE_MODE'] == 'batch':
+            # lepaskan koneksi request dulu supaya worker tidak kehabisan pool
+            db.session.commit()
+            try:
+                self._ensure_started().put_nowait(item)
+            except queue.Full:
+                pass  # antrian penuh: tulis langsung di bawah
+            else:
+                if not item.done.wait(app.config['SCORE_WRITE_TIMEOUT']):
+                    app.logger.warning('Nilai user %s belum di-commit setelah %ss', user_id, app.config['SCORE_WRITE_TIMEOUT'])
+                    if not item.claim('request'):
+                        # worker sedang menulisnya: tunggu sampai commit atau gagal
+                        item.done.wait()
+                    # else: masih di antrian, worker akan melewatinya; tulis sendiri di bawah
+                if item.owner == 'writer' and item.error is None:
+                    return item
+        # mode sync, antrian penuh, batch kehabisan waktu, atau gagal ditulis worker
+        save_quiz_result(user_id, score, total, attempt_id, item.taken_at, graded)
+        db.session.commit()
+        leaderboard_cache.record(user_id, username, score, item.taken_at)
+        if graded:
+            update_item_stats()
+        return item
+
+    def _run(self):
+        q = self._queue
+        while True:
+            item = q.get()
+            if item is self._STOP:
+                return
+            batch = [item] if item.claim('writer') else []
+            deadline = time.monotonic() + app.config['SCORE_BATCH_DELAY']
+            while len(batch) < app.config['SCORE_BATCH_SIZE']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._flush(batch)
+                    return
+                if item.claim('writer'):
+                    batch.append(item)
+            self._flush(batch)
+
+    def _write(self, batch):
+        answers = []
+        for item in batch:
+            save_quiz_result(item.user_id, item.score, item.total, item.attempt_id, item.taken_at)
+            if item.graded:
+                answers += answer_log_rows(item.user_id, item.score, item.attempt_id, item.taken_at, item.graded)
+        # log jawaban seluruh batch dalam satu INSERT
+        if answers:
+            db.session.execute(Answer.__table__.insert(), answers)
+        db.session.commit()
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        with app.app_context():
+            try:
+                self._write(batch)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Gagal menyimpan batch %d nilai, dicoba satu per satu', len(batch))
+                # request yang sudah berhenti menunggu tidak akan menulis ulang,
+                # jadi setiap nilai dicoba sendiri; yang tetap gagal dicatat
+                for item in batch:
+                    try:
+                        self._write([item])
+                    except Exception as e:
+                        db.session.rollback()
+                        app.logger.exception('Nilai user %s (skor %s, %s) gagal disimpan',
+                                             item.user_id, item.score, item.taken_at)
+                        item.error = e
+            finally:
+                db.session.remove()
+        for item in batch:
+            if item.error is None:
+                leaderboard_cache.record(item.user_id, item.username, item.score, item.taken_at)
+            item.done.set()
+        # setelah murid mendapat hasilnya, tidak menambah waktu tunggu submit
+        if any(item.graded for item in batch):
+            with app.app_context():
+                try:
+                    update_item_stats()
+                finally:
+                    db.session.remove()
+
+    def stop(self, timeout=10):
+        # dipanggil saat proses berhenti: sisa antrian tetap ditulis
+        with self._lock:
+            thread, q = self._thread, self._queue
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            q.put(self._STOP)
+            thread.join(timeout)
+
+
+score_writer = ScoreWriter()
+atexit.register(score_writer.stop)
+
+
+# ----- Cache fragmen & statistik -----
+# LRU di memori dengan TTL. Setiap tag ('material', 'question', 'dashboard')
+# punya nomor versi; invalidate(tag) menaikkan versi sehingga semua entri lama
+# tidak terpakai lagi. Dengan CACHE_BACKEND (file SQLite) versi tag dan isi
+# cache dibagi antar proses/worker.
+class SQLiteCacheBackend:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_tag (tag TEXT PRIMARY KEY, version INTEGER NOT NULL, changed_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entry (key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def tag_state(self, tag):
+        row = self._conn().execute('SELECT version, changed_at FROM cache_tag WHERE tag = ?', (tag,)).fetchone()
+        if row is None:
+            with self._conn() as conn:
+                conn.execute('INSERT OR IGNORE INTO cache_tag VALUES (?, 0, ?)', (tag, time.time()))
+            return self.tag_state(tag)
+        return row
+
+    def bump(self, tag):
+        with self._conn() as conn:
+            conn.execute('INSERT OR IGNORE INTO cache_tag VALUES (?, 0, ?)', (tag, time.time()))
+            conn.execute('UPDATE cache_tag SET version = version + 1, changed_at = ? WHERE tag = ?', (time.time(), tag))
+            conn.execute('DELETE FROM cache_entry WHERE key LIKE ?', (tag + ':%',))
+
+    def get_many(self, keys, version):
+        if not keys:
+            return {}
+        marks = ','.join('?' * len(keys))
+        rows = self._conn().execute(
+            f'SELECT key, value, expires FROM cache_entry WHERE version = ? AND key IN ({marks})',
+            [version] + list(keys)).fetchall()
+        now = time.time()
+        return {key: (json.loads(value), expires) for key, value, expires in rows if expires > now}
+
+    def set(self, key, version, value, expires):
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entry VALUES (?, ?, ?, ?)',
+                         (key, version, json.dumps(value), expires))
+
+
+class FragmentCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (version, expires, value)
+        self._tags = {}  # tag -> (version, changed_at), dipakai tanpa backend
+        self._backend = None
+        self._backend_path = None
+
+    def _get_backend(self):
+        path = app.config['CACHE_BACKEND']
+        if path != self._backend_path:
+            self._backend = SQLiteCacheBackend(path) if path else None
+            self._backend_path = path
+        return self._backend
+
+    def tag_state(self, tag):
+        backend = self._get_backend()
+        if backend is not None:
+            return backend.tag_state(tag)
+        with self._lock:
+            return self._tags.setdefault(tag, (0, time.time()))
+
+    def get_many(self, tag, keys):
+        version, _ = self.tag_state(tag)
+        now = time.time()
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                full_key = f'{tag}:{key}'
+                entry = self._entries.get(full_key)
+                if entry is not None and entry[0] == version and entry[1] > now:
+                    self._entries.move_to_end(full_key)
+                    found[key] = entry[2]
+                else:
+                    missing.append(key)
+        backend = self._get_backend()
+        if missing and backend is not None:
+            rows = backend.get_many([f'{tag}:{key}' for key in missing], version)
+            for key in missing:
+                hit = rows.get(f'{tag}:{key}')
+                if hit is not None:
+                    found[key] = hit[0]
+                    self._store(f'{tag}:{key}', version, hit[1], hit[0])
+        return found
+
+    def get(self, tag, key):
+        return self.get_many(tag, [key]).get(key)
+
+    def set(self, tag, key, value, ttl=None):
+        version, _ = self.tag_state(tag)
+        expires = time.time() + (ttl or app.config['CACHE_TTL'])
+        self._store(f'{tag}:{key}', version, expires, value)
+        backend = self._get_backend()
+        if backend is not None:
+            backend.set(f'{tag}:{key}', version, value, expires)
+
+    def _store(self, full_key, version, expires, value):
+        with self._lock:
+            self._entries[full_key] = (version, expires, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > app.config['CACHE_MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+
+    def reset_backend(self):
+        # setelah fork: koneksi SQLite milik proses induk tidak boleh dipakai
+        self._backend = None
+        self._backend_path = None
+
+    def invalidate(self, *tags):
+        backend = self._get_backend()
+        for tag in tags:
+            if backend is not None:
+                backend.bump(tag)
+            with self._lock:
+                version, _ = self._tags.get(tag, (0, 0))
+                self._tags[tag] = (version + 1, time.time())
+                for key in [k for k in self._entries if k.startswith(tag + ':')]:
+                    del self._entries[key]
+
+    def clear(self):
+        # semua tag yang pernah dipakai jadi tidak berlaku (mis. database dibuat ulang)
+        with self._lock:
+            tags = set(self._tags) | {key.split(':', 1)[0] for key in self._entries}
+        self.invalidate(*tags)
+
+
+page_cache = FragmentCache()
+
+
+def cached_fragment(tag, key, render):
+    # Fragmen disimpan bersama ETag-nya supaya tidak perlu di-hash ulang
+    fragment = page_cache.get(tag, key)
+    if fragment is None:
+        html = render()
+        fragment = {'html': html, 'etag': hashlib.sha1(html.encode('utf-8')).hexdigest()}
+        page_cache.set(tag, key, fragment)
+    return fragment
+
+
+def conditional_page(tag, fragment, render_page):
+    # Halaman berisi nama user di navbar, jadi ETag ikut user; pesan flash
+    # yang belum tampil membuat halaman tidak boleh dijawab 304.
+    response = make_response('')
+    response.set_etag(hashlib.sha1(f'{fragment["etag"]}:{current_user.get_id()}'.encode()).hexdigest())
+    response.last_modified = datetime.utcfromtimestamp(page_cache.tag_state(tag)[1]).replace(microsecond=0)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if '_flashes' not in session:
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    response.set_data(render_page(Markup(fragment['html'])))
+    return response
+
+
+# ----- Aset statis (fingerprint & kompresi) -----
+# `flask --app app build-assets` menyalin isi static/ ke ASSET_DIR dengan hash
+# isi file di namanya (style.3f2a9c1b7d4e.css), membuat versi .gz/.br untuk
+# CSS/JS/SVG, serta varian gambar yang diperkecil dan WebP (butuh Pillow;
+# brotli opsional). manifest.json memetakan nama asli ke nama baru; url_for
+# di template memakai manifest itu, dan /assets/ mengirim file dengan
+# Cache-Control immutable karena isi file dengan nama yang sama tidak berubah.
+# Tanpa manifest (belum di-build) URL static biasa tetap dipakai.
+ASSET_COMPRESS_EXTENSIONS = ('.css', '.js', '.svg')
+ASSET_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+_asset_manifest = {'mtime': None, 'entries': {}}
+_asset_manifest_lock = threading.Lock()
+
+
+def asset_manifest():
+    # dibaca ulang jika manifest.json berubah (build baru) tanpa restart;
+    # dalam satu request cukup sekali dicek, bukan di setiap url_for
+    if has_request_context():
+        entries = g.get('asset_manifest')
+        if entries is None:
+            entries = g.asset_manifest = load_asset_manifest()
+        return entries
+    return load_asset_manifest()
+
+
+def load_asset_manifest():
+    path = os.path.join(app.config['ASSET_DIR'], 'manifest.json')
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return {}
+    if mtime != _asset_manifest['mtime']:
+        with _asset_manifest_lock:
+            if mtime != _asset_manifest['mtime']:
+                with open(path, encoding='utf-8') as f:
+                    _asset_manifest['entries'] = json.load(f)
+                _asset_manifest['mtime'] = mtime
+    return _asset_manifest['entries']
+
+
+def asset_url_for(endpoint, **values):
+    if endpoint == 'static':
+        entry = asset_manifest().get(values.get('filename'))
+        if entry is not None:
+            values['filename'] = entry['file']
+            return url_for('asset', **values)
+    return url_for(endpoint, **values)
+
+
+def asset_srcset(filename, webp=False):
+    # "url 400w, url 800w" untuk <source> WebP atau <img srcset> format asli;
+    # kosong jika belum di-build atau tidak ada varian
+    variants = asset_manifest().get(filename, {}).get('variants', [])
+    return ', '.join(f"{url_for('asset', filename=v['file'])} {v['width']}w"
+                     for v in variants if (v['type'] == 'image/webp') == webp)
+
+
+app.jinja_env.globals.update(url_for=asset_url_for, asset_srcset=asset_srcset)
+
+
+def fingerprint_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def write_asset(rel_path, data):
+    path = os.path.join(app.config['ASSET_DIR'], rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return path
+
+
+def image_variants(rel_path, data, image_module):
+    # varian per lebar ASSET_IMAGE_WIDTHS (tidak diperbesar) + ukuran asli, format asli & WebP
+    from io import BytesIO
+    variants = []
+    with image_module.open(BytesIO(data)) as im:
+        im.load()
+        fmt = im.format
+        widths = sorted({w for w in app.config['ASSET_IMAGE_WIDTHS'] if w < im.width} | {im.width})
+        for width in widths:
+            resized = im if width == im.width else im.resize(
+                (width, max(1, round(im.height * width / im.width))), image_module.LANCZOS)
+            outputs = [(fmt, os.path.splitext(rel_path)[1], image_module.MIME.get(fmt))]
+            if fmt != 'WEBP':
+                outputs.append(('WEBP', '.webp', 'image/webp'))
+            for out_fmt, ext, mimetype in outputs:
+                if out_fmt == fmt and width == im.width:
+                    out = data  # ukuran asli format asli: file sumber apa adanya
+                else:
+                    frame = resized if resized.mode in ('RGB', 'RGBA', 'L') else resized.convert('RGBA')
+                    buf = BytesIO()
+                    frame.save(buf, out_fmt, quality=80, optimize=True)
+                    out = buf.getvalue()
+                stem = os.path.splitext(rel_path)[0]
+                name = fingerprint_name(f'{stem}.w{width}{ext}', out)
+                write_asset(name, out)
+                variants.append({'file': name, 'width': width, 'type': mimetype})
+    return variants
+
+
+def build_assets(echo=print):
+    static_dir = app.static_folder
+    out_dir = os.path.abspath(app.config['ASSET_DIR'])
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        echo('brotli tidak terpasang: hanya versi .gz yang dibuat')
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+        echo('Pillow tidak terpasang: varian gambar (resize/WebP) dilewati')
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != out_dir]
+        for name in sorted(files):
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, static_dir).replace(os.sep, '/')
+            with open(src, 'rb') as f:
+                data = f.read()
+            target = fingerprint_name(rel, data)
+            write_asset(target, data)
+            entry = {'file': target}
+            ext = os.path.splitext(name)[1].lower()
+            if ext in ASSET_COMPRESS_EXTENSIONS:
+                write_asset(target + '.gz', gzip.compress(data, 9, mtime=0))
+                if brotli is not None:
+                    write_asset(target + '.br', brotli.compress(data, quality=11))
+            elif ext in ASSET_IMAGE_EXTENSIONS and Image is not None:
+                try:
+                    entry['variants'] = image_variants(rel, data, Image)
+                except (OSError, ValueError) as e:
+                    echo(f'{rel}: gambar tidak bisa diproses ({e})')
+            manifest[rel] = entry
+    tmp = os.path.join(out_dir, 'manifest.json.tmp')
+    os.makedirs(out_dir, exist_ok=True)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, 'manifest.json'))
+    return manifest
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    # flask --app app build-assets (jalankan ulang setiap kali isi static/ berubah)
+    manifest = build_assets(echo=click.echo)
+    click.echo(f'{len(manifest)} aset ditulis ke {app.config["ASSET_DIR"]}')
+
+
+# ----- Upload gambar materi -----
+# File disimpan di MEDIA_DIR dengan nama hash SHA-256 isinya, jadi gambar yang
+# sama cukup disimpan sekali dan URL-nya boleh di-cache selamanya. Thumbnail
+# (lebar MEDIA_THUMB_WIDTHS, WebP + format asli) dibuat oleh pool latar
+# belakang; sampai selesai halaman materi memakai file aslinya.
+MEDIA_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+MEDIA_THUMB_FORMATS = {'jpg': ('JPEG', 'image/jpeg'), 'png': ('PNG', 'image/png'), 'gif': ('PNG', 'image/png')}
+
+
+def media_root():
+    path = app.config['MEDIA_DIR'] or os.path.join(app.instance_path, 'media')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def media_path(filename):
+    # path relatif di MEDIA_DIR: dua huruf pertama hash sebagai subfolder
+    return f'{filename[:2]}/{filename}'
+
+
+def sniff_image_type(head):
+    for signature, ext in MEDIA_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def store_material_image(upload):
+    # Mengembalikan (MaterialImage, baru?); ValueError jika bukan gambar atau terlalu besar
+    root = media_root()
+    os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.join(root, 'tmp'))
+    try:
+        digest, size, head = hashlib.sha256(), 0, b''
+        with os.fdopen(fd, 'wb') as f:
+            while chunk := upload.stream.read(65536):
+                size += len(chunk)
+                if size > app.config['MEDIA_MAX_BYTES']:
+                    raise ValueError(f'Ukuran gambar maksimal {app.config["MEDIA_MAX_BYTES"] // (1024 * 1024)} MB')
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                f.write(chunk)
+        ext = sniff_image_type(head)
+        if ext is None:
+            raise ValueError('File harus berupa gambar PNG, JPEG, GIF, atau WebP')
+        filename = f'{digest.hexdigest()}.{ext}'
+        path = os.path.join(root, media_path(filename))
+        image = db.session.get(MaterialImage, filename)
+        if image is not None and os.path.exists(path):
+            return image, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    if image is None:
+        image = MaterialImage(filename=filename, size_bytes=size)
+        db.session.add(image)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # upload file yang sama bersamaan dari request lain
+            db.session.rollback()
+            return db.session.get(MaterialImage, filename), False
+    thumbnail_runner.submit(filename)
+    return image, True
+
+
+def flatten_alpha(im, background=(255, 255, 255)):
+    # JPEG tidak punya alpha: bagian transparan diberi latar putih
+    if im.mode != 'RGBA':
+        return im.convert('RGB')
+    from PIL import Image
+    flat = Image.new('RGB', im.size, background)
+    flat.paste(im, mask=im.getchannel('A'))
+    return flat
+
+
+def generate_thumbnails(filename):
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        app.logger.warning('Pillow tidak terpasang: thumbnail %s tidak dibuat', filename)
+        return
+    image = db.session.get(MaterialImage, filename)
+    if image is None:
+        return
+    root = media_root()
+    stem, ext = filename.rsplit('.', 1)
+    variants = []
+    with Image.open(os.path.join(root, media_path(filename))) as im:
+        im = ImageOps.exif_transpose(im)  # foto dari HP sering disimpan miring
+        if im.mode in ('P', 'LA', 'PA') or 'transparency' in im.info:
+            im = im.convert('RGBA')  # GIF/PNG berpalet: transparansi tetap ada di PNG & WebP
+        elif im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGB')
+        image.width, image.height = im.size
+        outputs = [('WEBP', 'webp', 'image/webp')]
+        if ext in MEDIA_THUMB_FORMATS:
+            fmt, mimetype = MEDIA_THUMB_FORMATS[ext]
+            outputs.append((fmt, 'jpg' if fmt == 'JPEG' else 'png', mimetype))
+        for width in app.config['MEDIA_THUMB_WIDTHS']:
+            if width >= im.width:
+                continue
+            resized = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+            for fmt, out_ext, mimetype in outputs:
+                frame = flatten_alpha(resized) if fmt == 'JPEG' else resized
+                thumb = media_path(f'{stem}.w{width}.{out_ext}')
+                frame.save(os.path.join(root, thumb), fmt, quality=80, optimize=True)
+                variants.append({'file': thumb, 'width': width, 'type': mimetype})
+    image.variants = variants
+    db.session.commit()
+    page_cache.invalidate('material')
+
+
+class ThumbnailRunner:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, filename):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=app.config['MEDIA_THUMB_WORKERS'], thread_name_prefix='thumbnail')
+            return self._executor.submit(self._run, filename)
+
+    def _run(self, filename):
+        with app.app_context():
+            try:
+                generate_thumbnails(filename)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Gagal membuat thumbnail %s', filename)
+            finally:
+                db.session.remove()
+
+    def stop(self):
+        # gambar tanpa thumbnail bisa dilengkapi dengan `flask build-thumbnails`
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+thumbnail_runner = ThumbnailRunner()
+atexit.register(thumbnail_runner.stop)
+
+
+@app.cli.command('build-thumbnails')
+@click.option('--all', 'rebuild_all', is_flag=True, help='buat ulang semua, bukan hanya yang belum punya thumbnail')
+def build_thumbnails_command(rebuild_all):
+    # flask --app app build-thumbnails
+    query = db.session.query(MaterialImage.filename)
+    if not rebuild_all:
+        query = query.filter(db.or_(MaterialImage.width.is_(None), MaterialImage.variants == []))
+    filenames = [name for name, in query]
+    for filename in filenames:
+        generate_thumbnails(filename)
+    click.echo(f'{len(filenames)} gambar diproses.')
+
+
+def material_images(materials):
+    # gambar upload untuk daftar materi, {filename: MaterialImage}
+    names = {m.image_filename for m in materials if m.image_filename}
+    if not names:
+        return {}
+    return {i.filename: i for i in MaterialImage.query.filter(MaterialImage.filename.in_(names))}
+
+
+# ----- Instrumentasi request -----
+# Aktif jika METRICS_ENABLED: catat waktu total, jumlah & waktu query, dan
+# query paling lambat per endpoint. Hasilnya di /admin/metrics dan header
+# Server-Timing di setiap response.
+METRICS_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, wall_ms, queries, query_ms, slowest_ms, slowest):
+        with self._lock:
+            m = self._endpoints.get(endpoint)
+            if m is None:
+                m = self._endpoints[endpoint] = {
+                    'count': 0, 'wall_ms_total': 0.0, 'wall_ms_max': 0.0,
+                    'queries_total': 0, 'query_ms_total': 0.0,
+                    'slowest_query_ms': 0.0, 'slowest_query': None,
+                    'histogram': [0] * (len(METRICS_BUCKETS_MS) + 1),
+                }
+            m['count'] += 1
+            m['wall_ms_total'] += wall_ms
+            m['wall_ms_max'] = max(m['wall_ms_max'], wall_ms)
+            m['queries_total'] += queries
+            m['query_ms_total'] += query_ms
+            if slowest_ms > m['slowest_query_ms']:
+                m['slowest_query_ms'] = slowest_ms
+                m['slowest_query'] = slowest
+            m['histogram'][bisect_left(METRICS_BUCKETS_MS, wall_ms)] += 1
+
+    def snapshot(self):
+        labels = [f'<={b}ms' for b in METRICS_BUCKETS_MS] + [f'>{METRICS_BUCKETS_MS[-1]}ms']
+        out = {}
+        with self._lock:
+            for endpoint, m in self._endpoints.items():
+                out[endpoint] = {
+                    'count': m['count'],
+                    'wall_ms_avg': round(m['wall_ms_total'] / m['count'], 2),
+                    'wall_ms_max': round(m['wall_ms_max'], 2),
+                    'queries_avg': round(m['queries_total'] / m['count'], 2),
+                    'query_ms_avg': round(m['query_ms_total'] / m['count'], 2),
+                    'slowest_query_ms': round(m['slowest_query_ms'], 2),
+                    'slowest_query': m['slowest_query'],
+                    'histogram': dict(zip(labels, m['histogram'])),
+                }
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        g.metrics = {'start': time.perf_counter(), 'queries': 0, 'query_ms': 0.0,
+                     'slowest_ms': 0.0, 'slowest': None}
+
+
+@app.after_request
+def finish_request_metrics(response):
+    m = g.pop('metrics', None)
+    if m is None:
+        return response
+    wall_ms = (time.perf_counter() - m['start']) * 1000
+    request_metrics.record(request.endpoint or 'unknown', wall_ms, m['queries'], m['query_ms'],
+                           m['slowest_ms'], m['slowest'])
+    response.headers['Server-Timing'] = (
+        f'app;dur={wall_ms:.1f}, db;dur={m["query_ms"]:.1f};desc="{m["queries"]} queries"')
+    return response
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics' in g:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    if not (has_request_context() and 'metrics' in g):
+        return
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    ms = (time.perf_counter() - starts.pop()) * 1000
+    m = g.metrics
+    m['queries'] += 1
+    m['query_ms'] += ms
+    if ms > m['slowest_ms']:
+        m['slowest_ms'] = ms
+        m['slowest'] = statement[:500]
+
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', _query_started)
+    event.listen(db.engine, 'after_cursor_execute', _query_finished)
+
+
 # ----- Login loader -----
+# current_user diambil dari cache singkat (USER_CACHE_TTL) berisi salinan data
+# user yang tidak bisa diubah, bukan objek ORM, jadi request biasa tidak perlu
+# query ke tabel user. Entri dihapus saat password/role berubah; proses lain
+# melihat perubahan setelah TTL habis. Untuk mengubah user, muat User dari db.
+class UserSnapshot(UserMixin, namedtuple('UserSnapshot', 'id username role created_at')):
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.role, user.created_at)
+
+
+class UserCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        with self._lock:
+            self._entries[user_id] = (now + app.config['USER_CACHE_TTL'], snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > app.config['USER_CACHE_MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 
 # ----- Routes -----
@@ -105,9 +2120,15 @@ def register():
             return redirect(url_for('register'))
 
         u = User(username=username, role=role)
-        u.set_password(password)
+        try:
+            u.set_password(password)
+        except PasswordHashBusy:
+            flash('Server sedang sibuk, silakan coba daftar lagi.', 'warning')
+            return render_template('register.html'), 503
         db.session.add(u)
         db.session.commit()
+        user_cache.invalidate(u.id)
+        page_cache.invalidate('dashboard')
         flash(f'Registrasi {role.capitalize()} berhasil! Silakan login.', 'success')
         return redirect(url_for('login'))
     return render_template('register.html')
@@ -120,7 +2141,20 @@ def login():
         username = request.form['username'].strip()
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordHashBusy:
+            flash('Server sedang sibuk, silakan coba login lagi.', 'warning')
+            return render_template('login.html'), 503
+        if valid:
+            if user.password_needs_rehash():
+                # hash lama (metode/iterasi berbeda) diganti sesuai kebijakan sekarang
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                    user_cache.invalidate(user.id)
+                except PasswordHashBusy:
+                    pass
             login_user(user)
             flash('Login sukses', 'success')
             # redirect to admin dashboard if guru, else normal dashboard
@@ -164,8 +2198,13 @@ def reset_password(token):
     user = User.query.filter_by(username=email).first()
     if request.method == 'POST':
         new_password = request.form['new_password']
-        user.set_password(new_password)
+        try:
+            user.set_password(new_password)
+        except PasswordHashBusy:
+            flash('Server sedang sibuk, silakan coba lagi.', 'warning')
+            return render_template('reset_password.html', email=email), 503
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('Password berhasil diperbarui. Silakan login.', 'success')
         return redirect(url_for('login'))
 
@@ -193,8 +2232,9 @@ def dashboard():
     labels = [s.taken_at.strftime("%d %b %H:%M") for s in scores]
     data_scores = [s.score for s in scores]
 
-    avg_score = int(sum(data_scores) / len(data_scores)) if data_scores else 0
-    best_score = max(data_scores) if data_scores else 0
+    stats = user_score_stats(current_user.id)
+    avg_score = stats['avg_score']
+    best_score = stats['best_score']
 
     return render_template(
         'dashboard.html',
@@ -212,66 +2252,184 @@ def dashboard():
 @app.route('/material')
 @login_required
 def material():
-    mats = Material.query.all()
-    return render_template('material.html', materials=mats)
+    fragment = material_list_fragment()
+    return conditional_page('material', fragment, lambda html: render_template(
+        'material.html', materials_html=html))
+
+
+def material_list_fragment():
+    def render_list():
+        materials = Material.query.all()
+        return render_template('_material_list.html', materials=materials, images=material_images(materials))
+
+    return cached_fragment('material', 'list', render_list)
+
+
+# Pencarian materi (dan soal untuk guru), diurutkan dengan bm25
+def search_results(q, scope):
+    limit = app.config['SEARCH_RESULT_LIMIT']
+    results = {'materials': [], 'questions': []}
+    if scope in ('all', 'material'):
+        results['materials'] = search_materials(q, limit)
+    if scope in ('all', 'question') and current_user.role == 'guru':
+        results['questions'] = search_questions(q, limit)
+    return results
 
 
-# Start quiz (simple: all questions)
+@app.route('/search')
+@login_required
+def search():
+    q = request.args.get('q', '').strip()
+    scope = request.args.get('type', 'all')
+    results = search_results(q, scope) if q else {'materials': [], 'questions': []}
+    return render_template('search.html', q=q, scope=scope, results=results)
+
+
+# Kuis: soal acak per percobaan, ditampilkan per halaman
 @app.route('/quiz', methods=['GET', 'POST'])
 @login_required
 def quiz():
+    page_size = app.config['QUIZ_PAGE_SIZE']
+    attempt = current_quiz_attempt(current_user.id)
     if request.method == 'GET':
-        questions = Question.query.all()
-        return render_template('quiz.html', questions=questions)
-    # POST: grade
-    questions = Question.query.all()
-    total = len(questions)
-    correct_count = 0
-    for q in questions:
-        key = f'question_{q.id}'
-        given = request.form.get(key, '').strip()
-        if given != '':
-            if q.correct.strip().lower() == given.strip().lower():
-                correct_count += 1
-    score = int((correct_count / total) * 100) if total > 0 else 0
-    s = Score(user_id=current_user.id, score=score, total=total)
-    db.session.add(s)
-    db.session.commit()
+        if attempt is not None and attempt.is_expired():
+            # waktu habis saat murid pergi: nilai jawaban yang sudah tersimpan
+            session.pop('quiz_attempt_id', None)
+            result = finalize_attempt(attempt, current_user.username)
+            if result is not None:
+                flash('Waktu ujian habis. Jawaban yang tersimpan sudah dinilai.', 'warning')
+                score, correct_count, total = result
+                return render_template('result.html', score=score, total=total, correct=correct_count)
+            attempt = None
+        if attempt is None:
+            attempt = start_quiz_attempt(current_user.id)
+        ids = attempt.ids
+        pages = max(1, -(-len(ids) // page_size))
+        page = min(max(request.args.get('page', 1, type=int), 1), pages)
+        questions = questions_by_id(ids[(page - 1) * page_size:page * page_size])
+        return render_template('quiz.html', questions=questions, answers=attempt.get_answers(),
+                               page=page, pages=pages, offset=(page - 1) * page_size,
+                               attempt_id=attempt.id, remaining=attempt.remaining_seconds())
+
+    # POST: simpan jawaban halaman ini, pindah halaman atau nilai
+    action = request.form.get('action', 'finish')
+    if attempt is None:
+        # sesi kehilangan quiz_attempt_id: pakai percobaan dari form jika masih berjalan.
+        # Yang dinilai tetap hanya soal percobaan itu, dengan batas waktunya.
+        attempt = posted_quiz_attempt(current_user.id, request.form.get('attempt', type=int))
+        if attempt is not None and attempt.submitted_at is not None:
+            # form dikirim ulang (refresh / tombol kembali): cukup tampilkan hasilnya
+            return redirect(url_for('quiz_result', attempt_id=attempt.id))
+        if attempt is None:
+            flash('Tidak ada kuis yang sedang berjalan. Silakan mulai lagi.', 'warning')
+            return redirect(url_for('quiz'))
+    page = request.form.get('page', 1, type=int)
+    page_ids = attempt.ids[(page - 1) * page_size:page * page_size]
+    if action in ('next', 'prev') and not attempt.is_expired():
+        attempt.save_answers(request.form, page_ids)
+        db.session.commit()
+        session['quiz_attempt_id'] = attempt.id
+        return redirect(url_for('quiz', page=page + 1 if action == 'next' else page - 1))
+    session.pop('quiz_attempt_id', None)
+    result = finalize_attempt(attempt, current_user.username, form_answers(request.form, page_ids))
+    if result is None:
+        # submit ganda yang bersamaan: yang pertama sudah menilai
+        return redirect(url_for('quiz_result', attempt_id=attempt.id))
+    score, correct_count, total = result
     return render_template('result.html', score=score, total=total, correct=correct_count)
 
 
+@app.route('/quiz/result/<int:attempt_id>')
+@login_required
+def quiz_result(attempt_id):
+    attempt = posted_quiz_attempt(current_user.id, attempt_id)
+    if attempt is None or attempt.submitted_at is None:
+        abort(404)
+    if attempt.score is None:
+        # percobaan yang dinilai sebelum hasil disimpan di quiz_attempt
+        flash('Jawaban kuis ini sudah dikirim.', 'info')
+        return redirect(url_for('dashboard'))
+    return render_template('result.html', score=attempt.score, total=attempt.total, correct=attempt.correct_count)
+
+
+# Autosave jawaban kuis: {"question_id": 3, "answer": "A"} atau
+# {"answers": {"3": "A", "7": "True"}} (mis. antrean saat koneksi putus)
+@app.route('/quiz/answer', methods=['POST'])
+@login_required
+def quiz_autosave():
+    attempt = current_quiz_attempt(current_user.id)
+    if attempt is None:
+        return {'error': 'tidak ada kuis yang sedang berjalan'}, 404
+    if attempt.is_expired():
+        return {'error': 'waktu ujian sudah habis', 'remaining': 0}, 409
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {'error': 'body harus JSON'}, 400
+    raw = {data.get('question_id'): data.get('answer')} if 'question_id' in data else data.get('answers')
+    try:
+        answers = {int(qid): value for qid, value in raw.items()}
+    except (AttributeError, TypeError, ValueError):
+        return {'error': 'format jawaban tidak dikenal'}, 400
+    if not answers or len(answers) > app.config['QUIZ_AUTOSAVE_MAX_ANSWERS'] \
+            or not all(isinstance(v, str) and len(v) <= 200 for v in answers.values()):
+        return {'error': 'format jawaban tidak dikenal'}, 400
+    if not answers.keys() <= set(attempt.ids):
+        return {'error': 'soal tidak ada di kuis ini'}, 400
+    try:
+        save_attempt_answers(attempt.id, answers)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        save_attempt_answers(attempt.id, answers)
+        db.session.commit()
+    return {'saved': len(answers), 'remaining': attempt.remaining_seconds()}
+
+
 # Leaderboard
 @app.route('/leaderboard')
 @login_required
 def leaderboard():
-    subq = db.session.query(Score.user_id, db.func.max(Score.score).label('best_score')).group_by(Score.user_id).subquery()
-    results = db.session.query(User.username, subq.c.best_score).join(subq, User.id == subq.c.user_id).order_by(subq.c.best_score.desc()).limit(20).all()
-    return render_template('leaderboard.html', results=results)
+    period = request.args.get('period', 'all')
+    if period not in LEADERBOARD_PERIODS:
+        period = 'all'
+    results = leaderboard_cache.top(period)
+    my_rank = leaderboard_cache.rank_of(current_user.id, period)
+    return render_template('leaderboard.html', results=results, my_rank=my_rank,
+                           period=period, periods=LEADERBOARD_PERIODS)
 
 # ---------- USER PROFILE ----------
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
+    status = 200
     if request.method == 'POST':
         new_password = request.form.get('new_password')
         if new_password:
-            current_user.set_password(new_password)
-            db.session.commit()
-            flash('Password berhasil diperbarui!', 'success')
-            return redirect(url_for('profile'))
-
-    scores = Score.query.filter_by(user_id=current_user.id).all()
-    total_quiz = len(scores)
-    avg_score = int(sum([s.score for s in scores]) / total_quiz) if total_quiz > 0 else 0
-    best_score = max([s.score for s in scores]) if scores else 0
-    level = get_level(avg_score)
+            # current_user hanya salinan baca, ubah lewat objek User
+            user = db.session.get(User, current_user.id)
+            try:
+                user.set_password(new_password)
+            except PasswordHashBusy:
+                flash('Server sedang sibuk, silakan coba ubah password lagi.', 'warning')
+                status = 503
+            else:
+                db.session.commit()
+                user_cache.invalidate(user.id)
+                flash('Password berhasil diperbarui!', 'success')
+                return redirect(url_for('profile'))
+
+    stats = user_score_stats(current_user.id)
+    total_quiz = stats['total_quiz']
+    avg_score = stats['avg_score']
+    best_score = stats['best_score']
+    level = stats['level']
 
     return render_template('profile.html',
                            user=current_user,
                            total_quiz=total_quiz,
                            avg_score=avg_score,
                            best_score=best_score,
-                           level=level)
+                           level=level), status
 
 
 # ---------- LAPORAN GURU ----------
@@ -282,41 +2440,117 @@ def admin_report():
         flash('Akses ditolak! Hanya untuk guru.', 'danger')
         return redirect(url_for('dashboard'))
 
-    # Ambil semua murid
-    students = User.query.filter_by(role='murid').all()
-
-    # Hitung rata-rata skor setiap murid
-    report_data = []
-    for student in students:
-        scores = Score.query.filter_by(user_id=student.id).all()
-        if scores:
-            avg_score = int(sum([s.score for s in scores]) / len(scores))
-            best_score = max([s.score for s in scores])
-        else:
-            avg_score = 0
-            best_score = 0
-        report_data.append({
-            'username': student.username,
-            'avg_score': avg_score,
-            'best_score': best_score
-        })
+    # Rata-rata & skor tertinggi semua murid dalam satu query
+    report_data = student_score_summary()
 
     # Siapkan data untuk chart
     labels = [r['username'] for r in report_data]
     data_scores = [r['avg_score'] for r in report_data]
 
+    # ekspor latar belakang terbaru (dipakai bersama oleh semua guru)
+    jobs = ReportJob.query.order_by(ReportJob.id.desc()).limit(10).all()
+
     return render_template(
         'admin_report.html',
         report_data=report_data,
         labels=labels,
-        data_scores=data_scores
+        data_scores=data_scores,
+        jobs=jobs,
+        items=item_analysis()
     )
 
 import csv
-from io import StringIO
-from flask import make_response
+import zlib
+from io import StringIO, TextIOWrapper
+from flask import Response, send_file, send_from_directory, stream_with_context
+
+EXPORT_CHUNK_ROWS = 1000
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def export_filters(args):
+    # ValueError jika format tanggal salah; tanggal akhir ikut dihitung
+    start = parse_date(args.get('start'))
+    end = parse_date(args.get('end'))
+    if end is not None:
+        end += timedelta(days=1)
+    student = (args.get('student') or '').strip() or None
+    return start, end, student
+
+
+def iter_csv(header, rows):
+    # Tulis CSV per potongan kecil supaya memori tetap datar berapa pun jumlah barisnya
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % EXPORT_CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> format gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+EXPORT_HEADERS = {
+    'summary': ['Nama Siswa', 'Total Kuis', 'Rata-rata Skor', 'Skor Tertinggi', 'Tanggal Terakhir'],
+    'detail': ['Nama Siswa', 'Skor', 'Jumlah Soal', 'Tanggal'],
+}
+
+
+def score_detail_query(student=None, start=None, end=None):
+    query = db.session.query(User.username, Score.score, Score.total, Score.taken_at, Score.id).join(
+        Score, Score.user_id == User.id).filter(User.role == 'murid')
+    if student is not None:
+        query = query.filter(User.username == student)
+    if start is not None:
+        query = query.filter(Score.taken_at >= start)
+    if end is not None:
+        query = query.filter(Score.taken_at < end)
+    return query.order_by(Score.id)
+
+
+def summary_csv_row(row):
+    r = summary_row(row)
+    last_date = r['last_taken'].strftime('%d-%m-%Y') if r['last_taken'] else '-'
+    return [r['username'], r['total_quiz'], r['avg_score'], r['best_score'], last_date]
+
+
+def detail_csv_row(row):
+    username, score, total, taken_at, _ = row
+    return [username, score, total, taken_at.strftime('%d-%m-%Y %H:%M')]
+
+
+def export_summary_rows(query):
+    for row in query.yield_per(EXPORT_CHUNK_ROWS):
+        yield summary_csv_row(row)
+
+
+def export_detail_rows(query):
+    for row in query.yield_per(EXPORT_CHUNK_ROWS):
+        yield detail_csv_row(row)
+
 
 # ---------- EKSPOR DATA NILAI KE CSV ----------
+# Parameter opsional: start/end (YYYY-MM-DD), student (username),
+# mode=detail (satu baris per nilai), gzip=1 (dikompres jika browser mendukung)
+# Ekspor besar sebaiknya lewat job latar belakang (/admin/jobs) di bawah.
 @app.route('/admin/export_scores')
 @login_required
 def export_scores():
@@ -324,33 +2558,250 @@ def export_scores():
         flash('Akses ditolak! Hanya guru yang dapat mengekspor nilai.', 'danger')
         return redirect(url_for('dashboard'))
 
-    # Ambil semua siswa
-    students = User.query.filter_by(role='murid').all()
-
-    # Siapkan data CSV
-    csv_data = StringIO()
-    writer = csv.writer(csv_data)
-    writer.writerow(['Nama Siswa', 'Total Kuis', 'Rata-rata Skor', 'Skor Tertinggi', 'Tanggal Terakhir'])
-
-    for student in students:
-        scores = Score.query.filter_by(user_id=student.id).all()
-        if scores:
-            total_quiz = len(scores)
-            avg_score = int(sum([s.score for s in scores]) / total_quiz)
-            best_score = max([s.score for s in scores])
-            last_date = max([s.taken_at.strftime('%d-%m-%Y') for s in scores])
-        else:
-            total_quiz = 0
-            avg_score = 0
-            best_score = 0
-            last_date = '-'
-        writer.writerow([student.username, total_quiz, avg_score, best_score, last_date])
-
-    # Kirim file CSV ke browser
-    response = make_response(csv_data.getvalue())
-    response.headers['Content-Disposition'] = 'attachment; filename=laporan_nilai.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    return response
+    try:
+        start, end, student = export_filters(request.args)
+    except ValueError:
+        flash('Format tanggal harus YYYY-MM-DD.', 'danger')
+        return redirect(url_for('admin_report'))
+
+    if request.args.get('mode') == 'detail':
+        header = EXPORT_HEADERS['detail']
+        rows = export_detail_rows(score_detail_query(student, start, end))
+    else:
+        header = EXPORT_HEADERS['summary']
+        rows = export_summary_rows(student_score_query(username=student, start=start, end=end))
+
+    # Kirim file CSV ke browser secara bertahap
+    body = iter_csv(header, rows)
+    headers = {'Content-Disposition': 'attachment; filename=laporan_nilai.csv'}
+    if request.args.get('gzip') == '1' and request.accept_encodings['gzip']:
+        body = iter_gzip(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), mimetype='text/csv', headers=headers)
+
+
+# ---------- JOB LAPORAN LATAR BELAKANG ----------
+# Ekspor nilai dikerjakan oleh pool thread kecil (REPORT_WORKERS) dan
+# statusnya disimpan di tabel report_job, jadi worker web tidak tertahan dan
+# hasilnya bisa diunduh dari proses mana pun. Setiap job mencatat Score.id
+# terbesar saat dibuat: permintaan yang sama dipakai ulang sampai ada nilai
+# baru. File hasil (CSV gzip) disimpan di REPORT_DIR.
+REPORT_ACTIVE = ('queued', 'running')
+
+
+def report_dir():
+    path = app.config['REPORT_DIR'] or os.path.join(app.instance_path, 'reports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def current_score_version():
+    return db.session.query(db.func.max(Score.id)).scalar() or 0
+
+
+def report_job_params(args):
+    # parameter dinormalisasi supaya permintaan yang sama punya cache_key yang sama
+    export_filters(args)  # validasi tanggal
+    return {
+        'start': (args.get('start') or '').strip(),
+        'end': (args.get('end') or '').strip(),
+        'student': (args.get('student') or '').strip(),
+        'mode': 'detail' if args.get('mode') == 'detail' else 'summary',
+    }
+
+
+def report_cache_key(kind, params):
+    return hashlib.sha1(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()
+
+
+def iter_report_rows(params, until_id):
+    # Dibaca per potongan keyset dengan transaksi baca pendek, jadi SQLite tidak
+    # menahan lock baca selama ekspor besar dan penulisan nilai kuis tetap jalan.
+    # Score.id <= until_id membuat hasilnya konsisten walau nilai baru masuk.
+    start, end, student = export_filters(params)
+    if params['mode'] == 'detail':
+        query = score_detail_query(student, start, end).filter(Score.id <= until_id)
+        id_col, id_index, make_row = Score.id, -1, detail_csv_row
+    else:
+        # tanpa filter tanggal ringkasan dibaca dari StudentStats
+        if start is None and end is None:
+            until_id = None
+        query = student_score_query(username=student, start=start, end=end, until_id=until_id)
+        id_col, id_index, make_row = User.id, 0, summary_csv_row
+    last_id = 0
+    while True:
+        chunk = query.filter(id_col > last_id).limit(EXPORT_CHUNK_ROWS).all()
+        db.session.rollback()  # akhiri transaksi baca
+        if not chunk:
+            return
+        last_id = chunk[-1][id_index]
+        for row in chunk:
+            yield make_row(row)
+
+
+def run_report_job(job_id):
+    job = db.session.get(ReportJob, job_id)
+    if job is None or job.status != 'queued':
+        return
+    job.status, job.started_at = 'running', datetime.utcnow()
+    db.session.commit()
+    params = job.filters
+    path = os.path.join(report_dir(), f'{job.id}-{job.cache_key[:12]}.csv.gz')
+    rows = 0
+    try:
+        with gzip.open(path + '.tmp', 'wt', compresslevel=6, encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_HEADERS[params['mode']])
+            for row in iter_report_rows(params, job.score_version):
+                writer.writerow(row)
+                rows += 1
+        os.replace(path + '.tmp', path)
+    except BaseException:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        raise
+    job = db.session.get(ReportJob, job_id)
+    job.status, job.finished_at = 'done', datetime.utcnow()
+    job.result_file, job.result_rows = os.path.basename(path), rows
+    # hasil lama untuk permintaan yang sama sudah basi
+    for old in ReportJob.query.filter(ReportJob.cache_key == job.cache_key, ReportJob.id < job.id,
+                                      ReportJob.status.notin_(REPORT_ACTIVE)):
+        remove_report_file(old)
+        db.session.delete(old)
+    db.session.commit()
+
+
+def remove_report_file(job):
+    if job.result_file:
+        try:
+            os.remove(os.path.join(report_dir(), job.result_file))
+        except FileNotFoundError:
+            pass
+
+
+class ReportRunner:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, job_id):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=app.config['REPORT_WORKERS'], thread_name_prefix='report')
+            self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        with app.app_context():
+            try:
+                run_report_job(job_id)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception('Job laporan %s gagal', job_id)
+                job = db.session.get(ReportJob, job_id)
+                if job is not None:
+                    job.status, job.finished_at, job.error = 'failed', datetime.utcnow(), str(e)[:500]
+                    db.session.commit()
+            finally:
+                db.session.remove()
+
+    def stop(self):
+        # job yang belum mulai tetap 'queued' dan dianggap basi setelah REPORT_JOB_TIMEOUT
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+report_runner = ReportRunner()
+atexit.register(report_runner.stop)
+
+
+def start_report_job(kind, params, user_id):
+    # Mengembalikan (job, baru?); None jika guru ini sudah mencapai batas job aktif
+    version = current_score_version()
+    key = report_cache_key(kind, params)
+    job = ReportJob.query.filter(ReportJob.cache_key == key, ReportJob.score_version == version,
+                                 ReportJob.status != 'failed').order_by(ReportJob.id.desc()).first()
+    if job is not None and job.state != 'failed':
+        return job, False
+    active = ReportJob.query.filter(ReportJob.created_by == user_id, ReportJob.status.in_(REPORT_ACTIVE),
+                                    ReportJob.created_at > report_stale_before()).count()
+    if active >= app.config['REPORT_MAX_ACTIVE_PER_USER']:
+        return None, False
+    job = ReportJob(kind=kind, params=json.dumps(params, sort_keys=True), cache_key=key,
+                    score_version=version, created_by=user_id)
+    db.session.add(job)
+    db.session.commit()
+    report_runner.submit(job.id)
+    return job, True
+
+
+def report_stale_before():
+    return datetime.utcnow() - timedelta(seconds=app.config['REPORT_JOB_TIMEOUT'])
+
+
+def report_job_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'params': job.filters,
+        'status': job.state,
+        'rows': job.result_rows,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'download_url': url_for('report_job_download', id=job.id) if job.state == 'done' else None,
+    }
+
+
+@app.route('/admin/jobs', methods=['POST'])
+@login_required
+def report_job_start():
+    only_admin()
+    try:
+        params = report_job_params(request.form)
+    except ValueError:
+        flash('Format tanggal harus YYYY-MM-DD.', 'danger')
+        return redirect(url_for('admin_report'))
+    job, created = start_report_job('export', params, current_user.id)
+    if job is None:
+        flash('Masih ada ekspor yang sedang diproses. Tunggu sampai selesai.', 'warning')
+    elif created:
+        flash('Ekspor sedang disiapkan. File bisa diunduh di bawah setelah selesai.', 'info')
+    else:
+        flash('Ekspor yang sama sudah ada dan masih terbaru.', 'info')
+    return redirect(url_for('admin_report'))
+
+
+@app.route('/admin/jobs/<int:id>')
+@login_required
+def report_job_status(id):
+    only_admin()
+    return report_job_dict(ReportJob.query.get_or_404(id))
+
+
+@app.route('/admin/jobs/<int:id>/download')
+@login_required
+def report_job_download(id):
+    only_admin()
+    job = ReportJob.query.get_or_404(id)
+    if job.state != 'done':
+        abort(404)
+    path = os.path.join(report_dir(), job.result_file)
+    if not os.path.exists(path):
+        abort(404)
+    if request.accept_encodings['gzip']:
+        response = send_file(path, mimetype='text/csv', as_attachment=True, download_name='laporan_nilai.csv')
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    def body():
+        with gzip.open(path, 'rb') as f:
+            while chunk := f.read(65536):
+                yield chunk
+    return Response(body(), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=laporan_nilai.csv'})
 
 
 
@@ -359,7 +2810,16 @@ def export_scores():
 @login_required
 def admin_dashboard():
     only_admin()
+    days = request.args.get('days', app.config['DASHBOARD_CHART_DAYS'], type=int)
+    days = max(days or 0, 0)
+    stats = page_cache.get('dashboard', f'stats:{days}')
+    if stats is None:
+        stats = compute_dashboard_stats(days)
+        page_cache.set('dashboard', f'stats:{days}', stats, ttl=app.config['DASHBOARD_CACHE_TTL'])
+    return render_template('admin_dashboard.html', chart_days=days, **stats)
 
+
+def compute_dashboard_stats(days):
     # --- Statistik Ringkas ---
     total_users = User.query.count()
     total_murid = User.query.filter_by(role='murid').count()
@@ -367,40 +2827,29 @@ def admin_dashboard():
     total_material = Material.query.count()
     total_questions = Question.query.count()
 
-    # Rata-rata keseluruhan
-    avg_scores = db.session.query(db.func.avg(Score.score)).scalar() or 0
-    avg_scores = round(avg_scores, 2)
+    # Rata-rata keseluruhan (dari ringkasan per murid, tanpa memindai Score)
+    score_sum, attempts = db.session.query(
+        db.func.sum(StudentStats.score_sum), db.func.sum(StudentStats.attempts)).one()
+    avg_scores = round(score_sum / attempts, 2) if attempts else 0
 
     # --- Grafik Bar: Nilai Tertinggi Tiap Murid ---
-    subq = db.session.query(
-        Score.user_id,
-        db.func.max(Score.score).label('best_score')
-    ).group_by(Score.user_id).subquery()
-
-    murid_scores = db.session.query(User.username, subq.c.best_score).join(
-        subq, User.id == subq.c.user_id
-    ).filter(User.role == 'murid').order_by(subq.c.best_score.desc()).all()
+    murid_scores = db.session.query(User.username, StudentStats.best_score).join(
+        StudentStats, User.id == StudentStats.user_id
+    ).filter(User.role == 'murid').order_by(StudentStats.best_score.desc()).all()
 
     labels = [m[0] for m in murid_scores]
     data_scores = [m[1] for m in murid_scores]
 
-    # --- Grafik Line: Rata-rata Nilai Harian ---
-    from sqlalchemy import func
-    avg_per_day = (
-        db.session.query(
-            func.date(Score.taken_at).label("tanggal"),
-            func.avg(Score.score).label("rata")
-        )
-        .group_by(func.date(Score.taken_at))
-        .order_by(func.date(Score.taken_at))
-        .all()
-    )
+    # --- Grafik Line: Rata-rata Nilai Harian (dari DailyScoreRollup) ---
+    avg_per_day = DailyScoreRollup.query
+    if days:
+        avg_per_day = avg_per_day.filter(DailyScoreRollup.day > local_date(datetime.utcnow()) - timedelta(days=days))
+    avg_per_day = avg_per_day.order_by(DailyScoreRollup.day).all()
 
-    line_labels = [str(a[0]) for a in avg_per_day]
-    line_data = [round(a[1], 2) for a in avg_per_day]
+    line_labels = [str(r.day) for r in avg_per_day]
+    line_data = [round(r.score_sum / r.score_count, 2) for r in avg_per_day]
 
-    return render_template(
-        'admin_dashboard.html',
+    return dict(
         total_users=total_users,
         total_murid=total_murid,
         total_guru=total_guru,
@@ -421,8 +2870,38 @@ def admin_dashboard():
 @login_required
 def admin_material():
     only_admin()
-    materials = Material.query.all()
-    return render_template('admin_material.html', materials=materials)
+    # teks materi tidak ditampilkan di tabel admin, jadi tidak perlu dimuat
+    cache_key = 'admin_table:' + request.query_string.decode()
+    def render_table():
+        page = material_list_page()
+        return render_template('_admin_material_table.html', page=page, images=material_images(page['items']))
+
+    fragment = cached_fragment('material', cache_key, render_table)
+    return conditional_page('material', fragment, lambda html: render_template(
+        'admin_material.html', table_html=html, q=request.args.get('q', '')))
+
+
+def material_form_image():
+    # file yang diupload menggantikan nama file gambar yang diketik
+    upload = request.files.get('image_file')
+    if upload and upload.filename:
+        return store_material_image(upload)[0].filename
+    return request.form.get('image', '')
+
+
+# Upload gambar saja (mis. dari editor), hasilnya dipakai sebagai nama file gambar materi
+@app.route('/admin/material/image', methods=['POST'])
+@login_required
+def admin_material_image():
+    only_admin()
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return {'error': 'file gambar belum dipilih'}, 400
+    try:
+        image, created = store_material_image(upload)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {'filename': image.filename, 'url': image.url, 'new': created}, 201 if created else 200
 
 
 @app.route('/admin/material/add', methods=['GET', 'POST'])
@@ -432,10 +2911,15 @@ def admin_material_add():
     if request.method == 'POST':
         title = request.form['title']
         text = request.form['text']
-        image = request.form.get('image', '')
+        try:
+            image = material_form_image()
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return render_template('admin_material_form.html', mode='add', material=request.form)
         m = Material(title=title, text=text, image_filename=image)
         db.session.add(m)
         db.session.commit()
+        page_cache.invalidate('material', 'dashboard')
         flash('Materi berhasil ditambahkan!', 'success')
         return redirect(url_for('admin_material'))
     return render_template('admin_material_form.html', mode='add')
@@ -447,10 +2931,16 @@ def admin_material_edit(id):
     only_admin()
     m = Material.query.get_or_404(id)
     if request.method == 'POST':
+        try:
+            image = material_form_image()
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return render_template('admin_material_form.html', mode='edit', material=m)
         m.title = request.form['title']
         m.text = request.form['text']
-        m.image_filename = request.form.get('image', '')
+        m.image_filename = image
         db.session.commit()
+        page_cache.invalidate('material')
         flash('Materi berhasil diperbarui!', 'success')
         return redirect(url_for('admin_material'))
     return render_template('admin_material_form.html', mode='edit', material=m)
@@ -463,6 +2953,7 @@ def admin_material_delete(id):
     m = Material.query.get_or_404(id)
     db.session.delete(m)
     db.session.commit()
+    page_cache.invalidate('material', 'dashboard')
     flash('Materi dihapus!', 'info')
     return redirect(url_for('admin_material'))
 
@@ -472,8 +2963,9 @@ def admin_material_delete(id):
 @login_required
 def admin_question():
     only_admin()
-    questions = Question.query.all()
-    return render_template('admin_question.html', questions=questions)
+    page = question_list_page()
+    return render_template('admin_question.html', questions=page['items'], page=page,
+                           qtype=request.args.get('qtype', ''))
 
 
 @app.route('/admin/question/add', methods=['GET', 'POST'])
@@ -488,6 +2980,8 @@ def admin_question_add():
         q = Question(text=text, qtype=qtype, choices=choices, correct=correct)
         db.session.add(q)
         db.session.commit()
+        invalidate_answer_key()
+        page_cache.invalidate('question', 'dashboard')
         flash('Soal baru ditambahkan!', 'success')
         return redirect(url_for('admin_question'))
     return render_template('admin_question_form.html', mode='add')
@@ -504,6 +2998,8 @@ def admin_question_edit(id):
         q.choices = request.form.get('choices', '')
         q.correct = request.form['correct']
         db.session.commit()
+        invalidate_answer_key()
+        page_cache.invalidate('question', 'dashboard')
         flash('Soal diperbarui!', 'success')
         return redirect(url_for('admin_question'))
     return render_template('admin_question_form.html', mode='edit', question=q)
@@ -516,20 +3012,336 @@ def admin_question_delete(id):
     q = Question.query.get_or_404(id)
     db.session.delete(q)
     db.session.commit()
+    invalidate_answer_key()
+    page_cache.invalidate('question', 'dashboard')
     flash('Soal dihapus!', 'info')
     return redirect(url_for('admin_question'))
 
 
+# ---------- IMPOR / EKSPOR SOAL ----------
+# Bank soal dibaca per potongan (CSV, JSON array, atau JSON Lines), divalidasi
+# per baris, lalu disimpan per batch dengan satu executemany per batch.
+QUESTION_IMPORT_BATCH = 1000
+QUESTION_IMPORT_MAX_ERRORS = 200
+
+
+def question_dict(qid, text, qtype, choice_list, correct):
+    choices = [{'label': label, 'text': choice} for label, choice in choice_list or []]
+    return {'id': qid, 'text': text, 'type': qtype, 'choices': choices, 'correct': correct}
+
+
+def iter_json_array(stream, chunk_size=65536):
+    # Parser JSON array bertahap: hanya satu objek yang ditahan di memori.
+    # Menerima `[...]` atau format ekspor `{"questions": [...]}`.
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip(' \t\r\n')
+    if buf[pos:pos + 1] == '{':
+        while '[' not in buf[pos:] and not eof:
+            fill()
+        start = buf.find('[', pos)
+        if start < 0 or '"questions"' not in buf[pos:start]:
+            raise ValueError('JSON harus berupa array soal atau {"questions": [...]}')
+        pos = start
+    if buf[pos:pos + 1] != '[':
+        raise ValueError('JSON harus berupa array soal')
+    pos += 1
+    while True:
+        skip(' \t\r\n,')
+        if pos >= len(buf):
+            raise ValueError('JSON terpotong: array tidak ditutup')
+        if buf[pos] == ']':
+            return
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+        pos = end
+        yield obj
+
+
+def iter_question_rows(stream, fmt):
+    # Menghasilkan (nomor_baris, dict) dari file teks
+    if fmt == 'csv':
+        for i, row in enumerate(csv.DictReader(stream), 2):  # baris 1 = header
+            yield i, row
+    elif fmt == 'jsonl':
+        for i, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield i, json.loads(line)
+                except ValueError as e:
+                    # baris rusak ditolak sendiri-sendiri, baris berikutnya tetap diimpor
+                    yield i, ValueError(f'JSON tidak valid: {e}')
+    elif fmt == 'json':
+        for i, obj in enumerate(iter_json_array(stream), 1):
+            yield i, obj
+    else:
+        raise ValueError(f'Format tidak dikenal: {fmt}')
+
+
+def normalize_question_row(row):
+    # Mengembalikan dict siap insert, atau melempar ValueError dengan pesan
+    if isinstance(row, ValueError):
+        raise row  # baris yang gagal dibaca iter_question_rows
+    if not isinstance(row, dict):
+        raise ValueError('baris harus berupa objek')
+    text = str(row.get('text') or '').strip()
+    qtype = str(row.get('qtype') or row.get('type') or 'mcq').strip().lower()
+    correct = str(row.get('correct') or '').strip()
+    choices = row.get('choices') or ''
+    if isinstance(choices, list):
+        # format ekspor JSON: [{"label": "A", "text": "..."}] atau [["A", "..."]]
+        choices = ';;'.join(
+            f"{c['label']}||{c['text']}" if isinstance(c, dict) else f'{c[0]}||{c[1]}' for c in choices)
+    choices = str(choices).strip()
+    if not text:
+        raise ValueError('teks soal kosong')
+    if qtype not in ('mcq', 'tf'):
+        raise ValueError(f"tipe soal '{qtype}' harus mcq atau tf")
+    if not correct:
+        raise ValueError('jawaban benar kosong')
+    choice_list = None
+    if qtype == 'mcq':
+        choice_list = parse_choices(choices)
+        if not choice_list:
+            raise ValueError('soal pilihan ganda butuh pilihan (format A||teks;;B||teks)')
+        if correct.lower() not in {label.lower() for label, _ in choice_list}:
+            raise ValueError(f"jawaban '{correct}' tidak ada di pilihan")
+    elif correct.lower() not in ('true', 'false'):
+        raise ValueError('jawaban soal benar/salah harus True atau False')
+    return {'text': text, 'qtype': qtype, 'choices': choices or None,
+            'choice_list': choice_list, 'correct': correct}
+
+
+def import_questions(rows):
+    inserted, errors, batch = 0, [], []
+    table = Question.__table__
+
+    def flush():
+        nonlocal inserted, batch
+        if batch:
+            last_id = db.session.query(db.func.max(Question.id)).scalar() or 0
+            db.session.execute(table.insert(), batch)
+            # insert massal melewati event ORM, jadi index pencarian diisi di sini
+            conn = db.session.connection()
+            if search_index_ready(conn):
+                index_questions(conn, [question_index_row(*row) for row in db.session.query(
+                    Question.id, Question.text).filter(Question.id > last_id)])
+            db.session.commit()
+            inserted += len(batch)
+            batch = []
+
+    try:
+        for line_no, row in rows:
+            try:
+                batch.append(normalize_question_row(row))
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                if len(errors) < QUESTION_IMPORT_MAX_ERRORS:
+                    errors.append((line_no, str(e)))
+                continue
+            if len(batch) >= QUESTION_IMPORT_BATCH:
+                flush()
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        # file rusak di tengah jalan: baris valid sebelumnya tetap disimpan
+        errors.append((None, f'file tidak bisa dibaca: {e}'))
+    flush()
+    if inserted:
+        invalidate_answer_key()
+        page_cache.invalidate('question', 'dashboard')
+    return inserted, errors
+
+
+def question_import_format(filename, fmt=None):
+    fmt = (fmt or filename.rsplit('.', 1)[-1]).lower()
+    return fmt if fmt in ('csv', 'json', 'jsonl') else None
+
+
+@app.route('/admin/question/import', methods=['GET', 'POST'])
+@login_required
+def admin_question_import():
+    only_admin()
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        fmt = question_import_format(upload.filename if upload else '', request.form.get('format'))
+        if not upload or not upload.filename:
+            flash('Pilih file soal terlebih dahulu.', 'warning')
+            return redirect(url_for('admin_question_import'))
+        if fmt is None:
+            flash('Format file harus .csv, .json, atau .jsonl', 'danger')
+            return redirect(url_for('admin_question_import'))
+        stream = TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        inserted, errors = import_questions(iter_question_rows(stream, fmt))
+        result = {'inserted': inserted, 'errors': errors}
+        flash(f'{inserted} soal berhasil diimpor.', 'success' if inserted else 'warning')
+    return render_template('admin_question_import.html', result=result)
+
+
+@app.cli.command('import-questions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json', 'jsonl']), default=None)
+def import_questions_command(path, fmt):
+    # flask --app app import-questions bank_soal.csv
+    fmt = question_import_format(path, fmt)
+    if fmt is None:
+        raise click.UsageError('Format file harus .csv, .json, atau .jsonl (atau pakai --format)')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        inserted, errors = import_questions(iter_question_rows(f, fmt))
+    for line_no, message in errors:
+        click.echo(f'baris {line_no or "-"}: {message}', err=True)
+    click.echo(f'{inserted} soal diimpor, {len(errors)} baris ditolak.')
+
+
+def iter_questions_json(query):
+    # Bentuk sama dengan /admin/questions: {"questions": [...]}
+    yield '{"questions": ['
+    first = True
+    for row in query.yield_per(EXPORT_CHUNK_ROWS):
+        yield ('' if first else ', ') + json.dumps(question_dict(*row))
+        first = False
+    yield ']}'
+
+
+@app.route('/admin/questions/export')
+@login_required
+def admin_questions_export():
+    only_admin()
+    fmt = request.args.get('format', 'json')
+    query = db.session.query(Question.id, Question.text, Question.qtype, Question.choice_list,
+                             Question.correct).order_by(Question.id)
+    if fmt == 'csv':
+        rows = ([qid, text, qtype, ';;'.join(f'{l}||{t}' for l, t in choice_list or []), correct]
+                for qid, text, qtype, choice_list, correct in query.yield_per(EXPORT_CHUNK_ROWS))
+        body, mimetype = iter_csv(['id', 'text', 'qtype', 'choices', 'correct'], rows), 'text/csv'
+    elif fmt == 'jsonl':
+        body = (json.dumps(question_dict(*row)) + '\n' for row in query.yield_per(EXPORT_CHUNK_ROWS))
+        mimetype = 'application/x-ndjson'
+    else:
+        fmt, body, mimetype = 'json', iter_questions_json(query), 'application/json'
+    headers = {'Content-Disposition': f'attachment; filename=bank_soal.{fmt}'}
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
 # Simple route to view raw questions (for admin/testing)
+# Sekarang per halaman juga; sama dengan /api/v1/questions
 @app.route('/admin/questions')
 @login_required
 def admin_questions():
+    return api_v1_questions()
+
+
+# ---------- API JSON v1 ----------
+# Daftar dengan paginasi keyset: ?cursor=...&size=50, ambil next_cursor dari
+# response untuk halaman berikutnya.
+@app.route('/api/v1/questions')
+@login_required
+def api_v1_questions():
     only_admin()
-    qs = Question.query.all()
-    out = []
-    for q in qs:
-        out.append({'id': q.id, 'text': q.text, 'type': q.qtype, 'choices': q.choices, 'correct': q.correct})
-    return {'questions': out}
+    page = question_list_page()
+    return {
+        'questions': [question_dict(*row) for row in page['items']],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+    }
+
+
+@app.route('/api/v1/materials')
+@login_required
+def api_v1_materials():
+    only_admin()
+    page = material_list_page()
+    return {
+        'materials': [{'id': m.id, 'title': m.title, 'image': m.image_filename} for m in page['items']],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+    }
+
+
+@app.route('/api/v1/search')
+@login_required
+def api_v1_search():
+    q = request.args.get('q', '').strip()
+    results = search_results(q, request.args.get('type', 'all')) if q else {'materials': [], 'questions': []}
+    # snippet berisi <mark> di sekitar kata yang cocok, teks lain sudah di-escape
+    return {
+        'query': q,
+        'materials': [{'id': m['id'], 'title': str(m['title']), 'snippet': str(m['snippet'])}
+                      for m in results['materials']],
+        'questions': [{'id': item['id'], 'snippet': str(item['snippet'])} for item in results['questions']],
+    }
+
+
+# Aset hasil build-assets: nama berisi hash isi, jadi boleh di-cache selamanya.
+# Versi .br/.gz dikirim jika browser mendukung. manifest.json tidak ber-hash
+# dan hanya dipakai server, jadi tidak dikirim.
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    if filename == 'manifest.json':
+        abort(404)
+    asset_dir = app.config['ASSET_DIR']
+    mimetype = mimetypes.guess_type(filename)[0]
+    send_name, encoding = filename, None
+    for enc, ext in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(asset_dir, filename + ext)
+        if request.accept_encodings[enc] and path is not None and os.path.isfile(path):
+            send_name, encoding = filename + ext, enc
+            break
+    response = send_from_directory(asset_dir, send_name, mimetype=mimetype, max_age=app.config['ASSET_MAX_AGE'])
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if os.path.splitext(filename)[1].lower() in ASSET_COMPRESS_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+# Gambar upload: nama file berisi hash isinya, jadi tidak pernah berubah.
+# Hanya file hasil upload/thumbnail; file sementara di tmp/ tidak dikirim.
+MEDIA_FILE = re.compile(r'[0-9a-f]{2}/[0-9a-f]{64}(\.w\d+)?\.(png|jpg|gif|webp)')
+
+
+@app.route('/media/<path:filename>')
+def media(filename):
+    if not MEDIA_FILE.fullmatch(filename):
+        abort(404)
+    response = send_from_directory(media_root(), filename, max_age=app.config['ASSET_MAX_AGE'])
+    response.cache_control.immutable = True
+    return response
+
+
+# Statistik instrumentasi per endpoint (aktifkan dengan BIOKUIZ_METRICS=1)
+@app.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    only_admin()
+    return {
+        'enabled': app.config['METRICS_ENABLED'],
+        'buckets_ms': list(METRICS_BUCKETS_MS),
+        'endpoints': request_metrics.snapshot(),
+    }
 
 
 # Error handlers
@@ -543,6 +3355,56 @@ def not_found(e):
     return render_template('404.html'), 404
 
 
+@app.errorhandler(413)
+def request_too_large(e):
+    limit = (request.max_content_length or 0) // (1024 * 1024)
+    message = f'File terlalu besar (maksimal {limit} MB).'
+    if request.endpoint == 'admin_material_image':
+        return {'error': message}, 413
+    flash(message, 'danger')
+    return redirect(request.url)
+
+
+# ----- Server produksi (lihat serve.py) -----
+# Route didaftarkan saat modul diimpor, jadi "factory" ini mengembalikan app
+# yang sama setelah menerapkan konfigurasi tambahan. Konfigurasi database
+# sudah dipakai saat impor dan tidak bisa diganti di sini.
+def create_app(config=None):
+    if config:
+        app.config.update(config)
+    return app
+
+
+def preload_app():
+    # kompilasi semua template sekali di proses induk; worker hasil fork
+    # mewarisi hasilnya tanpa menyalin memori (copy-on-write)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    asset_manifest()
+
+
+def warm_caches():
+    # kunci jawaban, soal (sebanyak muat di page_cache) dan fragmen daftar materi
+    answer_key = get_answer_key()
+    limit = app.config['CACHE_MAX_ENTRIES'] // 2
+    ids = sorted(answer_key)[:limit]
+    for q in Question.query.filter(Question.id.in_(ids)):
+        page_cache.set('question', q.id, question_cache_entry(q))
+    with app.test_request_context('/material'):
+        material_list_fragment()
+    db.session.remove()
+    return {'questions': len(ids), 'answer_key': len(answer_key)}
+
+
+def after_fork():
+    # Dipanggil di setiap worker: koneksi & state acak tidak boleh dibagi
+    # dengan proses induk atau worker lain.
+    with app.app_context():
+        db.engine.dispose(close=False)
+    page_cache.reset_backend()
+    random.seed()
+
+
 # Run
 if __name__ == '__main__':
     app.run(debug=True)
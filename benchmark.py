@@ -0,0 +1,1218 @@
+# Benchmark sederhana untuk jalur-jalur panas Biokuiz.
+# Jalankan: python benchmark.py <nama> (lihat --help)
+# Uji beban rute utama: python benchmark.py routes --json hasil.json
+# Semua benchmark memakai database SQLite sementara, bukan biokuiz.db.
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.mkdtemp(prefix='biokuiz-bench-')
+os.environ.setdefault('BIOKUIZ_DATABASE_URI', 'sqlite:///' + os.path.join(_tmpdir, 'bench.db'))
+
+from sqlalchemy import event  # noqa: E402
+
+from config import DB_PROFILES  # noqa: E402
+from db_init import bulk_insert, generate_school  # noqa: E402
+import app as biokuiz  # noqa: E402
+from app import (  # noqa: E402
+    app, db, build_assets, install_sqlite_pragmas, Answer, Material, MaterialImage, Question, ReportJob, Score, User, leaderboard_cache, score_writer,
+    compute_dashboard_stats, encode_cursor, page_cache, record_score, import_questions, iter_question_rows, grade_answers, get_answer_key, invalidate_answer_key,
+    item_analysis, rebuild_daily_rollup, rebuild_item_stats, rebuild_search_index, refresh_item_stats, save_quiz_result, request_metrics, search_materials,
+    student_score_summary, user_cache,
+)
+
+# Benchmark memakai hash password termurah; hanya login_storm yang mengukur biaya hash.
+BENCH_HASH_METHOD = 'pbkdf2:sha256:1'
+
+
+def reset_db():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    # jangan ada benchmark yang membaca cache dari database sebelumnya
+    user_cache.clear()
+    page_cache.clear()
+    leaderboard_cache.invalidate()
+    invalidate_answer_key()
+
+
+@contextlib.contextmanager
+def count_queries():
+    counter = {'queries': 0}
+
+    def _count(*_):
+        counter['queries'] += 1
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _count)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', _count)
+
+
+def seed_school(students, scores_per_student=5, seed=42, start=datetime(2024, 1, 1), days=365, questions=0):
+    # Isi database kosong dengan murid & nilai sintetis (generator db_init.py)
+    reset_db()
+    generate_school(students, questions, students * scores_per_student, seed=seed, start=start, days=days)
+
+
+def login_client(username, password='bench', role='murid'):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        user = User(username=username, role=role)
+        db.session.add(user)
+    user.set_password(password)
+    db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': password})
+    return client
+
+
+def current_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def latency(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': round(percentile(samples, 50), 2), 'p99_ms': round(percentile(samples, 99), 2)}
+
+
+RESULTS = {}  # untuk --json
+
+
+def report(name, rows):
+    RESULTS[name] = rows
+    print(f'== {name} ==')
+    for row in rows:
+        print('  ' + '  '.join(f'{k}={v}' for k, v in row.items()))
+
+
+# ---------- Penilaian kuis ----------
+def bench_grading(args):
+    rows = []
+    for n in (10, 100, 1000):
+        reset_db()
+        db.session.add_all([
+            Question(text=f'Soal {i}', qtype='mcq', choices='A||a;;B||b', correct=' A ')
+            for i in range(n)
+        ])
+        db.session.commit()
+        invalidate_answer_key()
+        form = {f'question_{q.id}': 'a' for q in Question.query.all()}
+
+        def old_loop():
+            correct_count = 0
+            for q in Question.query.all():
+                given = form.get(f'question_{q.id}', '').strip()
+                if given != '' and q.correct.strip().lower() == given.strip().lower():
+                    correct_count += 1
+            return correct_count
+
+        def cached():
+            return grade_answers(get_answer_key(), form)[0]
+
+        assert old_loop() == cached() == n
+        t_old = timeit(old_loop, args.repeat)
+        t_new = timeit(cached, args.repeat)
+        rows.append({'questions': n, 'loop_ms': round(t_old * 1000, 3),
+                     'cache_ms': round(t_new * 1000, 3), 'speedup': round(t_old / t_new, 1)})
+    report('grading', rows)
+
+
+# ---------- Laporan guru (agregasi nilai) ----------
+def bench_report(args):
+    rows = []
+    for n in (100, 1000, 10000):
+        seed_school(n)
+
+        def n_plus_one():
+            out = []
+            for student in User.query.filter_by(role='murid').all():
+                scores = Score.query.filter_by(user_id=student.id).all()
+                out.append((student.username, len(scores), max(s.score for s in scores)))
+            return out
+
+        def grouped():
+            return student_score_summary()
+
+        repeat = max(1, args.repeat // 10)
+        with count_queries() as q_old:
+            t_old = timeit(n_plus_one, repeat)
+        with count_queries() as q_new:
+            t_new = timeit(grouped, repeat)
+        rows.append({'students': n,
+                     'loop_queries': q_old['queries'] // repeat, 'loop_ms': round(t_old * 1000, 1),
+                     'grouped_queries': q_new['queries'] // repeat, 'grouped_ms': round(t_new * 1000, 1)})
+    report('report', rows)
+
+
+# ---------- Ekspor CSV streaming ----------
+def bench_export(args):
+    rows = []
+    for n in (100, 100000, 1000000):
+        seed_school(max(1, n // 500), scores_per_student=min(n, 500))
+        client = login_client('guru_bench', role='guru')
+        db.session.remove()
+        rss_before = current_rss_kb()
+        rss_peak = rss_before
+        size = 0
+        start = time.perf_counter()
+        first_byte = None
+        response = client.get('/admin/export_scores?mode=detail', buffered=False)
+        for i, chunk in enumerate(response.response):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+            if i % 50 == 0:
+                rss_peak = max(rss_peak, current_rss_kb())
+        response.close()
+        elapsed = time.perf_counter() - start
+        rows.append({'score_rows': n, 'bytes': size, 'first_byte_ms': round(first_byte * 1000, 1),
+                     'total_s': round(elapsed, 2), 'rss_growth_kb': rss_peak - rss_before})
+    report('export', rows)
+
+
+# ---------- Leaderboard ----------
+def bench_leaderboard(args):
+    rows = []
+    for n in (50000, 500000):
+        seed_school(n // 50, scores_per_student=50, start=datetime.utcnow() - timedelta(days=14), days=14)
+        client = login_client('murid1')
+
+        def group_by_scan():
+            subq = db.session.query(Score.user_id, db.func.max(Score.score).label('best_score')).group_by(Score.user_id).subquery()
+            db.session.query(User.username, subq.c.best_score).join(subq, User.id == subq.c.user_id).order_by(
+                subq.c.best_score.desc()).limit(20).all()
+
+        row = {'score_rows': n}
+        row.update({'scan_' + k: v for k, v in latency(group_by_scan, max(1, args.repeat // 5)).items()})
+        for period in ('all', 'week', 'today'):
+            leaderboard_cache.invalidate()
+            stats = latency(lambda: client.get('/leaderboard?period=' + period), args.repeat)
+            row.update({period + '_' + k: v for k, v in stats.items()})
+        rows.append(row)
+    report('leaderboard', rows)
+
+
+# ---------- Sesi kuis vs ukuran bank soal ----------
+def seed_questions(n):
+    bulk_insert(Question.__table__, (
+        {'text': f'Soal nomor {i}', 'qtype': 'mcq', 'choices': 'A||Ginjal;;B||Hati;;C||Paru-paru;;D||Kulit', 'correct': 'A'}
+        for i in range(n)
+    ))
+    db.session.commit()
+    invalidate_answer_key()
+
+
+def bench_quiz_session(args):
+    rows = []
+    for n in (100, 10000, 100000):
+        reset_db()
+        seed_questions(n)
+        client = login_client('murid1')
+        get_answer_key()  # kunci jawaban dibangun sekali, lalu dipakai semua percobaan
+
+        def new_attempt():
+            with client.session_transaction() as sess:
+                sess.pop('quiz_attempt_id', None)
+            client.get('/quiz')
+
+        row = {'questions': n}
+        row.update(latency(new_attempt, args.repeat))
+        rows.append(row)
+    report('quiz_session', rows)
+
+
+# ---------- Render quiz.html ----------
+# Salinan quiz.html lama yang memecah string `choices` di setiap render
+OLD_QUIZ_TEMPLATE = '''{% extends "base.html" %}
+{% block content %}
+<h2 class="text-center text-primary mb-4">🧠 Kuis Sistem Ekskresi</h2>
+
+<form method="post" class="mx-auto" style="max-width:700px;">
+  {% for q in questions %}
+  <div class="card mb-3 shadow-sm">
+    <div class="card-body">
+      <h5 class="card-title">{{ loop.index }}. {{ q.text }}</h5>
+      {% if q.qtype == 'mcq' %}
+        {% for p in q.choices.split(';;') if q.choices %}
+          {% set kv = p.split('||') %}
+          <div class="form-check">
+            <input class="form-check-input" type="radio" name="question_{{ q.id }}" value="{{ kv[0] }}" id="q{{ q.id }}{{ kv[0] }}">
+            <label class="form-check-label" for="q{{ q.id }}{{ kv[0] }}">{{ kv[0] }}. {{ kv[1] }}</label>
+          </div>
+        {% endfor %}
+      {% elif q.qtype == 'tf' %}
+        <div class="form-check">
+          <input class="form-check-input" type="radio" name="question_{{ q.id }}" value="True" id="t{{ q.id }}">
+          <label class="form-check-label" for="t{{ q.id }}">Benar</label>
+        </div>
+        <div class="form-check">
+          <input class="form-check-input" type="radio" name="question_{{ q.id }}" value="False" id="f{{ q.id }}">
+          <label class="form-check-label" for="f{{ q.id }}">Salah</label>
+        </div>
+      {% endif %}
+    </div>
+  </div>
+  {% endfor %}
+
+  <div class="text-center">
+    <button type="submit" class="btn btn-success btn-lg px-5">Kirim Jawaban</button>
+  </div>
+</form>
+{% endblock %}'''
+
+
+def bench_quiz_render(args):
+    from flask import render_template, render_template_string
+    reset_db()
+    db.session.add_all([
+        Question(text=f'Soal nomor {i}', qtype='mcq', choices='A||Ginjal;;B||Hati;;C||Paru-paru;;D||Kulit', correct='A')
+        for i in range(500)
+    ])
+    db.session.commit()
+
+    def before():
+        db.session.expunge_all()
+        render_template_string(OLD_QUIZ_TEMPLATE, questions=Question.query.all())
+
+    def after():
+        db.session.expunge_all()
+        render_template('quiz.html', questions=Question.query.all(), answers={}, page=1, pages=1, offset=0)
+
+    with app.test_request_context('/quiz'):
+        row = {'questions': 500}
+        row.update({'before_' + k: v for k, v in latency(before, args.repeat).items()})
+        row.update({'after_' + k: v for k, v in latency(after, args.repeat).items()})
+    report('quiz_render', [row])
+
+
+# ---------- Submit kuis bersamaan ----------
+def seed_students_with_password(n, password='bench'):
+    from werkzeug.security import generate_password_hash
+    pw_hash = generate_password_hash(password, method=BENCH_HASH_METHOD)  # murah, hanya untuk benchmark
+    bulk_insert(User.__table__, (
+        {'username': f'murid{i}', 'password_hash': pw_hash, 'role': 'murid', 'created_at': datetime.utcnow()}
+        for i in range(n)
+    ))
+    db.session.commit()
+
+
+def run_concurrent(fn, workers):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    barrier = threading.Barrier(workers)
+
+    def task(i):
+        barrier.wait()
+        start = time.perf_counter()
+        ok = fn(i)
+        return ok, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(task, range(workers)))
+    elapsed = time.perf_counter() - start
+    samples = [ms for _, ms in results]
+    return {'requests': workers, 'errors': sum(1 for ok, _ in results if not ok),
+            'rps': round(workers / elapsed, 1),
+            'p50_ms': round(percentile(samples, 50), 1), 'p99_ms': round(percentile(samples, 99), 1)}
+
+
+def bench_quiz_submit(args):
+    rows = []
+    workers = 200
+    page_size = app.config['QUIZ_PAGE_SIZE']
+    app.config['QUIZ_PAGE_SIZE'] = 20  # semua jawaban dikirim dalam satu halaman
+    for mode in ('sync', 'batch'):
+        reset_db()
+        seed_questions(20)
+        seed_students_with_password(workers)
+        score_writer.stop()
+        app.config['SCORE_WRITE_MODE'] = mode
+        clients = []
+        for i in range(workers):
+            client = app.test_client()
+            client.post('/login', data={'username': f'murid{i}', 'password': 'bench'})
+            client.get('/quiz')
+            clients.append(client)
+        form = {f'question_{i}': 'A' for i in range(1, 21)}
+        form.update(page=1, action='finish')
+
+        def submit(i):
+            try:
+                return clients[i].post('/quiz', data=form).status_code == 200
+            except Exception:
+                return False
+
+        row = {'mode': mode}
+        row.update(run_concurrent(submit, workers))
+        db.session.remove()
+        row['scores_saved'] = Score.query.count()
+        rows.append(row)
+    score_writer.stop()
+    app.config['QUIZ_PAGE_SIZE'] = page_size
+    report('quiz_submit', rows)
+
+
+def bench_exam(args):
+    # ujian serentak: semua murid menekan "Kirim" saat waktu habis. Bandingkan kiriman
+    # penuh (semua jawaban di form) dengan autosave per jawaban + kiriman akhir kosong.
+    workers = 200
+    old = {k: app.config[k] for k in ('QUIZ_PAGE_SIZE', 'QUIZ_TIME_LIMIT', 'SCORE_WRITE_MODE')}
+    app.config.update(QUIZ_PAGE_SIZE=20, QUIZ_TIME_LIMIT=600, SCORE_WRITE_MODE='batch')
+    rows = []
+    try:
+        for flow in ('full_post', 'autosave'):
+            reset_db()
+            seed_questions(20)
+            seed_students_with_password(workers)
+            score_writer.stop()
+            clients = []
+            for i in range(workers):
+                client = app.test_client()
+                client.post('/login', data={'username': f'murid{i}', 'password': 'bench'})
+                client.get('/quiz')
+                clients.append(client)
+            form = {f'question_{i}': 'A' for i in range(1, 21)}
+
+            if flow == 'autosave':
+                # sepanjang ujian: satu request kecil per jawaban, 200 murid bersamaan
+                for qid in range(1, 21):
+                    def save(i, qid=qid):
+                        try:
+                            return clients[i].post('/quiz/answer', json={'question_id': qid, 'answer': 'A'}).status_code == 200
+                        except Exception:
+                            return False
+                    stats = run_concurrent(save, workers)
+                row = {'flow': flow, 'step': 'autosave (per jawaban)'}
+                row.update(stats)
+                rows.append(row)
+                form = {}
+
+            def finish(i):
+                try:
+                    return clients[i].post('/quiz', data=dict(form, action='finish', page=1)).status_code == 200
+                except Exception:
+                    return False
+
+            row = {'flow': flow, 'step': 'kirim saat waktu habis'}
+            row.update(run_concurrent(finish, workers))
+            score_writer.stop()
+            db.session.remove()
+            row['scores_saved'] = Score.query.count()
+            row['answers_logged'] = Answer.query.count()
+            rows.append(row)
+    finally:
+        score_writer.stop()
+        app.config.update(old)
+    report('exam', rows)
+
+
+# ---------- Profil database (baca/tulis campuran) ----------
+def bench_db_profiles(args):
+    import threading
+    from sqlalchemy import create_engine, exc, text
+    rows = []
+    threads, ops_per_thread, write_ratio = 16, 200, 0.2
+    for profile in ('dev', 'sqlite-production'):
+        path = os.path.join(_tmpdir, f'profile-{profile}.db')
+        if os.path.exists(path):
+            os.remove(path)
+        engine = create_engine('sqlite:///' + path, **DB_PROFILES[profile]['engine_options'])
+        install_sqlite_pragmas(engine, DB_PROFILES[profile]['sqlite_pragmas'])
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert(), [
+                {'username': f'murid{i}', 'password_hash': 'x', 'role': 'murid'} for i in range(500)])
+            conn.execute(Score.__table__.insert(), [
+                {'user_id': i % 500 + 1, 'score': i % 101, 'total': 10, 'taken_at': datetime.utcnow()}
+                for i in range(20000)])
+
+        samples, errors = [], []
+        lock = threading.Lock()
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            local, failed = [], 0
+            for _ in range(ops_per_thread):
+                uid = rnd.randint(1, 500)
+                start = time.perf_counter()
+                try:
+                    if rnd.random() < write_ratio:
+                        with engine.begin() as conn:
+                            conn.execute(Score.__table__.insert(), {
+                                'user_id': uid, 'score': rnd.randint(0, 100), 'total': 10,
+                                'taken_at': datetime.utcnow()})
+                    else:
+                        with engine.connect() as conn:
+                            conn.execute(text('SELECT count(*), avg(score), max(score) FROM score WHERE user_id = :u'),
+                                         {'u': uid}).all()
+                except exc.OperationalError:
+                    failed += 1
+                local.append((time.perf_counter() - start) * 1000)
+            with lock:
+                samples.extend(local)
+                errors.append(failed)
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+        rows.append({'profile': profile, 'ops': len(samples), 'errors': sum(errors),
+                     'ops_per_s': round(len(samples) / elapsed, 1),
+                     'p50_ms': round(percentile(samples, 50), 2), 'p99_ms': round(percentile(samples, 99), 2)})
+    report('db_profiles', rows)
+
+
+# ---------- Grafik harian dashboard guru ----------
+def bench_dashboard(args):
+    from sqlalchemy import func
+    rows = []
+    for years in (1, 3, 5):
+        seed_school(1000, scores_per_student=100 * years,
+                    start=datetime.utcnow() - timedelta(days=365 * years), days=365 * years)
+        rebuild_daily_rollup()
+
+        def full_scan():
+            db.session.query(func.date(Score.taken_at), func.avg(Score.score)).group_by(
+                func.date(Score.taken_at)).order_by(func.date(Score.taken_at)).all()
+
+        repeat = max(1, args.repeat // 10)
+        row = {'years': years, 'score_rows': Score.query.count()}
+        row.update({'scan_' + k: v for k, v in latency(full_scan, repeat).items()})
+        row.update({'stats30_' + k: v for k, v in latency(lambda: compute_dashboard_stats(30), repeat).items()})
+        rows.append(row)
+    report('dashboard', rows)
+
+
+# ---------- Analisis butir soal ----------
+def answer_rows(submissions, questions, per_quiz=20, seed=11, first_user=1):
+    # model sederhana: peluang benar naik dengan kemampuan murid, turun dengan kesulitan soal
+    rnd = random.Random(seed)
+    hardness = [rnd.random() for _ in range(questions)]
+    now = datetime.utcnow()
+    for sub in range(submissions):
+        ability = rnd.random()
+        qids = rnd.sample(range(1, questions + 1), per_quiz)
+        results = [rnd.random() < 0.2 + 0.8 * ability * (1 - hardness[q - 1] / 2) for q in qids]
+        score = int(sum(results) * 100 / per_quiz)
+        for qid, ok in zip(qids, results):
+            yield {'user_id': first_user, 'attempt_id': None, 'question_id': qid,
+                   'choice': 'a' if ok else rnd.choice('bcd'), 'correct': ok, 'score': score, 'answered_at': now}
+
+
+def bench_item_stats(args):
+    rows = []
+    questions = 500
+    for answers in (100000, 1000000):
+        reset_db()
+        seed_questions(questions)
+        db.session.add(User(username='murid1', password_hash='x', role='murid'))
+        bulk_insert(Answer.__table__, answer_rows(answers // 20, questions))
+        db.session.commit()
+        start = time.perf_counter()
+        rebuild_item_stats()
+        rebuild_s = time.perf_counter() - start
+
+        seed = iter(range(100, 10 ** 6))
+
+        def new_answers_then_refresh():
+            # 50 submit baru (1000 jawaban) lalu penulis nilai memperbarui agregat
+            bulk_insert(Answer.__table__, answer_rows(50, questions, seed=next(seed)))
+            db.session.commit()
+            start = time.perf_counter()
+            refresh_item_stats()
+            return (time.perf_counter() - start) * 1000
+
+        refresh_ms = sorted(new_answers_then_refresh() for _ in range(max(1, args.repeat // 5)))
+        rows.append({'answers': answers, 'full_pass_s': round(rebuild_s, 2),
+                     'refresh_1k_new_ms_p50': round(percentile(refresh_ms, 50), 1),
+                     **{'report_' + k: v for k, v in latency(item_analysis, args.repeat).items()}})
+
+    # biaya tulis per submit: 20 baris Answer ikut dalam transaksi nilai
+    for with_answers in (False, True):
+        graded = [(qid, 'a', True) for qid in range(1, 21)]
+        rows.append({'submit_write': 'score+answers' if with_answers else 'score only',
+                     **latency(lambda: (save_quiz_result(1, 100, 20, graded=graded if with_answers else None),
+                                        db.session.commit()), args.repeat)})
+    report('item_stats', rows)
+
+
+# ---------- Impor bank soal ----------
+def bench_question_import(args):
+    import csv
+    import json
+    rows = []
+    n = 50000
+    for fmt in ('csv', 'json'):
+        reset_db()
+        path = os.path.join(_tmpdir, f'bank.{fmt}')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            if fmt == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(['text', 'qtype', 'choices', 'correct'])
+                for i in range(n):
+                    writer.writerow([f'Soal nomor {i} tentang ekskresi', 'mcq', 'A||Ginjal;;B||Hati;;C||Paru-paru;;D||Kulit', 'A'])
+            else:
+                f.write('[')
+                for i in range(n):
+                    f.write((',' if i else '') + json.dumps({'text': f'Soal nomor {i} tentang ekskresi', 'qtype': 'tf', 'correct': 'True'}))
+                f.write(']')
+        rss_before = current_rss_kb()
+        start = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as f:
+            inserted, errors = import_questions(iter_question_rows(f, fmt))
+        elapsed = time.perf_counter() - start
+        rows.append({'format': fmt, 'rows': n, 'inserted': inserted, 'errors': len(errors),
+                     'seconds': round(elapsed, 2), 'rows_per_s': int(n / elapsed),
+                     'rss_growth_kb': current_rss_kb() - rss_before})
+    report('question_import', rows)
+
+
+# ---------- Daftar admin (paginasi keyset) ----------
+def bench_admin_pages(args):
+    rows = []
+    for n in (1000, 100000):
+        reset_db()
+        seed_questions(n)
+        client = login_client('guru_bench', role='guru')
+        deep = encode_cursor(n - 100, 'next')
+        row = {'questions': n}
+        row.update({'first_' + k: v for k, v in latency(lambda: client.get('/api/v1/questions'), args.repeat).items()})
+        row.update({'deep_' + k: v for k, v in latency(
+            lambda: client.get('/api/v1/questions?cursor=' + deep), args.repeat).items()})
+        row.update({'all_rows_' + k: v for k, v in latency(
+            lambda: [q.id for q in Question.query.all()], max(1, args.repeat // 10)).items()})
+        rows.append(row)
+    report('admin_pages', rows)
+
+
+# ---------- Pencarian: FTS5 vs LIKE ----------
+SEARCH_VOCAB = (
+    'ginjal hati paru-paru kulit darah urin keringat empedu racun zat sisa metabolisme '
+    'menyaring mengeluarkan menghasilkan membantu berfungsi pengeluaran penyaringan '
+    'organ sistem ekskresi manusia tubuh air garam mineral karbon dioksida uap'
+).split()
+
+
+def seed_materials(n, seed=7):
+    # kata biologi di antara 5000 kata pengisi dengan frekuensi ala Zipf,
+    # supaya kata yang dicari tidak muncul di hampir semua materi
+    rng = random.Random(seed)
+    words = [f'kata{i}' for i in range(5000)]
+    for word in SEARCH_VOCAB:
+        words.insert(rng.randrange(50, 2000), word)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    bulk_insert(Material.__table__, (
+        {'title': f'Materi {i} ' + ' '.join(rng.choices(words, weights, k=3)),
+         # satu dari seribu materi menyebut nefron (kata yang jarang)
+         'text': ' '.join(rng.choices(words, weights, k=60)) + (' nefron' if i % 1000 == 0 else ''),
+         'image_filename': None}
+        for i in range(n)
+    ))
+    db.session.commit()
+
+
+def bench_search(args):
+    rows = []
+    n = 100000
+    reset_db()
+    seed_materials(n)
+    start = time.perf_counter()
+    rebuild_search_index()
+    build_s = round(time.perf_counter() - start, 2)
+    limit = app.config['SEARCH_RESULT_LIMIT']
+    for term, like_term in (('nefron', 'nefron'), ('saring', 'saring'), ('ginjal darah', 'ginjal')):
+        row = {'rows': n, 'term': term.replace(' ', '+'), 'index_build_s': build_s,
+               'fts_hits': len(search_materials(term, limit)),
+               'like_hits': Material.query.filter(Material.text.ilike(f'%{like_term}%')).count()}
+        row.update({'fts_' + k: v for k, v in latency(lambda: search_materials(term, limit), args.repeat).items()})
+        # LIKE tidak punya peringkat: harus menghitung semua baris yang cocok dulu
+        row.update({'like_' + k: v for k, v in latency(
+            lambda: Material.query.filter(Material.text.ilike(f'%{like_term}%')).order_by(
+                Material.id).limit(limit).all(), args.repeat).items()})
+        row.update({'like_count_' + k: v for k, v in latency(
+            lambda: Material.query.filter(Material.text.ilike(f'%{like_term}%')).count(),
+            max(1, args.repeat // 10)).items()})
+        rows.append(row)
+    report('search', rows)
+
+
+# ---------- Job ekspor latar belakang ----------
+def write_scores_while(busy, user_id):
+    # simulasi kuis yang terus mengirim nilai selama ekspor berjalan
+    samples, errors = [], 0
+    with app.app_context():
+        while busy():
+            start = time.perf_counter()
+            try:
+                record_score(user_id, 80, 10)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                errors += 1
+            samples.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+        db.session.remove()
+    return samples, errors
+
+
+def bench_report_jobs(args):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    rows = []
+    seed_school(2000, scores_per_student=250)  # 500 ribu nilai
+    client = login_client('guru_bench', role='guru')
+    writer_id = User.query.filter_by(username='murid0').first().id
+    app.config['REPORT_DIR'] = tempfile.mkdtemp(prefix='biokuiz-reports-')
+    db.session.remove()
+
+    def measure(label, run_export):
+        done = threading.Event()
+        with ThreadPoolExecutor(1) as pool:
+            writes = pool.submit(write_scores_while, lambda: not done.is_set(), writer_id)
+            time.sleep(0.05)
+            row = run_export()
+            done.set()
+            samples, errors = writes.result()
+        row = {'mode': label, **row, 'score_writes': len(samples), 'write_errors': errors,
+               'write_p50_ms': round(percentile(samples, 50), 1) if samples else None,
+               'write_max_ms': round(max(samples), 1) if samples else None}
+        rows.append(row)
+
+    def sync_export():
+        start = time.perf_counter()
+        client.get('/admin/export_scores?mode=detail').get_data()
+        return {'request_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+    def job_export():
+        start = time.perf_counter()
+        client.post('/admin/jobs', data={'mode': 'detail'})
+        request_ms = (time.perf_counter() - start) * 1000
+        with app.app_context():
+            job_id = ReportJob.query.order_by(ReportJob.id.desc()).first().id
+            db.session.remove()
+        while client.get(f'/admin/jobs/{job_id}').get_json()['status'] not in ('done', 'failed'):
+            time.sleep(0.05)
+        return {'request_ms': round(request_ms, 1), 'job_s': round(time.perf_counter() - start, 2)}
+
+    measure('sync', sync_export)
+    measure('job', job_export)
+    rows.append({'mode': 'job-idle', **job_export()})
+    # tanpa nilai baru, permintaan yang sama langsung memakai hasil yang ada
+    with app.app_context():
+        version_before = db.session.query(db.func.max(ReportJob.id)).scalar()
+        start = time.perf_counter()
+        client.post('/admin/jobs', data={'mode': 'detail'})
+        reuse_ms = (time.perf_counter() - start) * 1000
+        reused = db.session.query(db.func.max(ReportJob.id)).scalar() == version_before
+        db.session.remove()
+    rows.append({'mode': 'job-cached', 'request_ms': round(reuse_ms, 1), 'reused': reused})
+    report('report_jobs', rows)
+
+
+# ---------- Login serentak (biaya hash password) ----------
+def set_password_policy(method, workers):
+    if biokuiz._password_pool is not None:
+        biokuiz._password_pool.shutdown(wait=True)
+        biokuiz._password_pool = None
+    app.config['PASSWORD_HASH_METHOD'] = method
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+
+
+def bench_login_storm(args):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.security import generate_password_hash
+    rows = []
+    students = 40
+    bounded = app.config['PASSWORD_HASH_WORKERS']
+    cases = [
+        ('pbkdf2:sha256:600000', 'pbkdf2:sha256:600000', students),
+        ('pbkdf2:sha256:600000', 'pbkdf2:sha256:600000', bounded),
+        ('pbkdf2:sha256:260000', 'pbkdf2:sha256:260000', bounded),
+        ('pbkdf2:sha256:100000', 'pbkdf2:sha256:100000', bounded),
+        ('scrypt:32768:8:1', 'scrypt:32768:8:1', bounded),
+        # hash lama diperbarui ke kebijakan baru saat login pertama
+        ('pbkdf2:sha256:600000', 'pbkdf2:sha256:260000', bounded),
+    ]
+    for stored, policy, workers in cases:
+        reset_db()
+        pw_hash = generate_password_hash('bench', stored)
+        bulk_insert(User.__table__, (
+            {'username': f'murid{i}', 'password_hash': pw_hash, 'role': 'murid', 'created_at': datetime.utcnow()}
+            for i in range(students)
+        ))
+        db.session.commit()
+        set_password_policy(BENCH_HASH_METHOD, workers)
+        other = login_client('murid_lain')
+        set_password_policy(policy, workers)
+        db.session.remove()
+        clients = [app.test_client() for _ in range(students)]
+
+        def do_login(i):
+            return clients[i].post('/login', data={'username': f'murid{i}', 'password': 'bench'}).status_code == 302
+
+        # route lain (dashboard murid) yang diakses selama badai login
+        done = threading.Event()
+
+        def other_traffic():
+            samples = []
+            while not done.is_set():
+                start = time.perf_counter()
+                other.get('/dashboard')
+                samples.append((time.perf_counter() - start) * 1000)
+            return samples
+
+        with ThreadPoolExecutor(1) as pool:
+            background = pool.submit(other_traffic)
+            result = run_concurrent(do_login, students)
+            done.set()
+            samples = background.result()
+        row = {'stored': stored, 'policy': policy, 'hash_workers': workers, 'logins': students}
+        row.update(result)
+        row['other_p50_ms'] = round(percentile(samples, 50), 1) if samples else None
+        row['other_p99_ms'] = round(percentile(samples, 99), 1) if samples else None
+        row['rehashed'] = User.query.filter(User.password_hash.like(policy + '$%')).count() if stored != policy else 0
+        rows.append(row)
+    set_password_policy(BENCH_HASH_METHOD, bounded)
+    report('login_storm', rows)
+
+
+# ---------- Cache user (current_user) ----------
+def bench_user_loader(args):
+    from concurrent.futures import ThreadPoolExecutor
+    rows = []
+    seed_school(200, scores_per_student=20)
+    db.session.add(Material(title='Sistem Ekskresi', text='Ginjal menyaring darah.', image_filename=None))
+    db.session.commit()
+    client = login_client('murid1')
+    db.session.remove()
+    app.config['METRICS_ENABLED'] = True
+
+    def measure(path):
+        # dijalankan di thread lain supaya setiap request punya app context &
+        # session sendiri seperti di server (bukan identity map bersama)
+        client.get(path)  # isi cache fragmen & user
+        request_metrics.reset()
+        lat = latency(lambda: client.get(path), args.repeat)
+        endpoint = next(iter(request_metrics.snapshot().values()))
+        return {'queries_per_request': endpoint['queries_avg'], 'query_ms_avg': endpoint['query_ms_avg'], **lat}
+
+    with ThreadPoolExecutor(1) as pool:
+        for ttl in (0, 30):
+            # TTL 0 = setiap request memuat user dari database (perilaku lama)
+            app.config['USER_CACHE_TTL'] = ttl
+            user_cache.clear()  # snapshot lama masih memakai TTL sebelumnya
+            for path in ('/material', '/dashboard', '/leaderboard'):
+                rows.append({'user_cache_ttl': ttl, 'path': path, **pool.submit(measure, path).result()})
+    app.config['METRICS_ENABLED'] = False
+    app.config['USER_CACHE_TTL'] = 30
+    user_cache.clear()
+    report('user_loader', rows)
+
+
+# ---------- Aset statis ----------
+def bench_static_assets(args):
+    rows = []
+    reset_db()
+    db.session.add(Material(title='Ginjal', text='Ginjal menyaring darah.', image_filename='ginjal.png'))
+    db.session.commit()
+    client = login_client('murid1')
+    asset_dir = app.config['ASSET_DIR']
+    headers = {'Accept-Encoding': 'gzip, br'}
+    for built in (False, True):
+        app.config['ASSET_DIR'] = tempfile.mkdtemp(prefix='biokuiz-assets-')
+        if built:
+            build_assets(echo=lambda msg: None)
+        page_cache.invalidate('material')
+        html = client.get('/material').get_data(as_text=True)
+        urls = re.findall(r'(?:href|src)="(/(?:static|assets)/[^"]+)"', html)
+        first_bytes, reload_requests, etags = 0, 0, {}
+        for url in urls:
+            r = client.get(url, headers=headers)
+            first_bytes += len(r.data)
+            etags[url] = (r.headers.get('ETag'), r.cache_control)
+        # muat ulang halaman: aset immutable tidak diminta lagi, sisanya divalidasi ulang (304)
+        for url, (etag, cache_control) in etags.items():
+            if cache_control.immutable and cache_control.max_age:
+                continue
+            reload_requests += 1
+            client.get(url, headers={**headers, 'If-None-Match': etag or ''})
+        css = next(u for u in urls if '.css' in u)
+        rows.append({'built': built, 'assets': len(urls), 'first_load_bytes': first_bytes,
+                     'reload_requests': reload_requests,
+                     'css_encoding': client.get(css, headers=headers).headers.get('Content-Encoding') or '-',
+                     **latency(lambda: client.get(css, headers=headers), args.repeat)})
+    app.config['ASSET_DIR'] = asset_dir
+    report('static_assets', rows)
+
+
+def photo_bytes(width, height, seed):
+    # foto sintetis: gradien + derau agar ukuran JPEG mendekati foto asli
+    from PIL import Image
+    rng = random.Random(seed)
+    base = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.effect_noise((width, height), rng.randint(20, 60)).convert('RGB')
+    buf = io.BytesIO()
+    Image.blend(base, noise, 0.5).save(buf, 'JPEG', quality=92)
+    return buf.getvalue()
+
+
+def pick_candidate(srcset, needed_px):
+    # pilihan browser: kandidat terkecil yang cukup lebar, atau yang terbesar
+    candidates = sorted((int(w[:-1]), url) for url, w in (c.rsplit(' ', 1) for c in srcset.split(', ')))
+    return next((url for w, url in candidates if w >= needed_px), candidates[-1][1])
+
+
+def bench_material_images(args):
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print('material_images: Pillow tidak terpasang, dilewati')
+        return
+    reset_db()
+    app.config['MEDIA_DIR'] = tempfile.mkdtemp(prefix='biokuiz-media-')
+    client = login_client('guru1', role='guru')
+    n = 8
+    photos = [photo_bytes(3000, 2000, i) for i in range(n)]
+    upload_ms, started = [], time.perf_counter()
+    for i, data in enumerate(photos):
+        t = time.perf_counter()
+        r = client.post('/admin/material/add', data={
+            'title': f'Materi {i}', 'text': 'Ginjal menyaring darah.', 'image_file': (io.BytesIO(data), f'{i}.jpg')})
+        upload_ms.append((time.perf_counter() - t) * 1000)
+        assert r.status_code == 302, r.status_code
+    # upload ulang file yang sama: tidak disimpan dua kali
+    dup = client.post('/admin/material/image', data={'file': (io.BytesIO(photos[0]), 'lagi.jpg')}).get_json()
+    while MaterialImage.query.filter(MaterialImage.variants == []).count():
+        db.session.rollback()
+        time.sleep(0.05)
+    thumbs_s = time.perf_counter() - started
+    page_cache.invalidate('material')
+    html = client.get('/material').get_data(as_text=True)
+    imgs = re.findall(r'<picture>.*?</picture>', html, re.S)
+    # kolom 50vw pada layar 800px, DPR 2 -> butuh 800px
+    original_bytes = sum(len(p) for p in photos)
+    eager_bytes = lazy_bytes = 0
+    for tag in imgs:
+        webp = re.search(r'type="image/webp" srcset="([^"]+)"', tag).group(1)
+        size = len(client.get(pick_candidate(webp, 800)).data)
+        if 'loading="lazy"' in tag:
+            lazy_bytes += size
+        else:
+            eager_bytes += size
+    report('material_images', [
+        {'variant': 'original', 'images': n, 'initial_bytes': original_bytes, 'deferred_bytes': 0},
+        {'variant': 'srcset+lazy', 'images': len(imgs), 'initial_bytes': eager_bytes, 'deferred_bytes': lazy_bytes,
+         'upload_ms_p50': round(percentile(upload_ms, 50), 1), 'thumbnails_s': round(thumbs_s, 2),
+         'stored_files': sum(len(f) for _, _, f in os.walk(app.config['MEDIA_DIR'])), 'duplicate_new': dup['new']},
+    ])
+
+
+# ---------- Uji beban rute utama ----------
+# Setiap rute dijalankan lewat test client (berurutan, jumlah query per
+# request dihitung) dan lewat server HTTP lokal dengan banyak thread klien.
+class ClientSession:
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        r = self.client.open(path, method=method, data=data)
+        return r.status_code, r.get_data()
+
+
+class HTTPSession:
+    def __init__(self, base_url):
+        from http.cookiejar import CookieJar
+        from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+
+        class NoRedirect(HTTPRedirectHandler):
+            def redirect_request(self, *args):
+                return None  # 302 dilaporkan apa adanya, seperti test client
+
+        self.base_url = base_url
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect)
+
+    def request(self, method, path, data=None):
+        from urllib.error import HTTPError
+        from urllib.parse import urlencode
+        from urllib.request import Request
+        body = urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(Request(self.base_url + path, data=body, method=method)) as r:
+                return r.status, r.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+
+def logged_in(new_session, username):
+    session = new_session()
+    status, _ = session.request('POST', '/login', {'username': username, 'password': 'bench'})
+    assert status == 302, f'login {username}: {status}'
+    return session
+
+
+def quiz_submit_request(new_session, session, username):
+    # buka kuis dulu (tidak diukur) supaya submit menilai percobaan yang aktif
+    _, html = session.request('GET', '/quiz')
+    ids = dict.fromkeys(re.findall(rb'name="question_(\d+)"', html))
+    form = {f'question_{int(i)}': random.choice('ABCD') for i in ids}
+    return session, 'POST', '/quiz', {**form, 'page': '1', 'action': 'finish'}
+
+
+def simple_request(method, path):
+    return lambda new_session, session, username: (session, method, path, None)
+
+
+# rute -> (role, fungsi yang menyiapkan (session, method, path, data))
+ROUTE_STEPS = {
+    'login': ('murid', lambda new_session, session, username: (
+        new_session(), 'POST', '/login', {'username': username, 'password': 'bench'})),
+    'quiz_get': ('murid', simple_request('GET', '/quiz')),
+    'quiz_post': ('murid', quiz_submit_request),
+    'leaderboard': ('murid', simple_request('GET', '/leaderboard')),
+    'dashboard': ('murid', simple_request('GET', '/dashboard')),
+    'admin': ('guru', simple_request('GET', '/admin')),
+    'admin_report': ('guru', simple_request('GET', '/admin/report')),
+    'export_scores': ('guru', simple_request('GET', '/admin/export_scores')),
+}
+ROUTE_OK = {'login': 302}
+
+
+def load_summary(samples, errors, elapsed):
+    return {'requests': len(samples), 'errors': errors, 'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(samples, 50), 2), 'p95_ms': round(percentile(samples, 95), 2),
+            'p99_ms': round(percentile(samples, 99), 2)}
+
+
+def run_route_client(name, repeat):
+    role, prepare = ROUTE_STEPS[name]
+    username = 'guru1' if role == 'guru' else 'murid1'
+    session = logged_in(ClientSession, username)
+    samples, errors, queries, busy = [], 0, 0, 0.0
+    for _ in range(repeat):
+        s, method, path, data = prepare(ClientSession, session, username)
+        with count_queries() as counter:
+            start = time.perf_counter()
+            status, _ = s.request(method, path, data)
+            elapsed = time.perf_counter() - start
+        busy += elapsed
+        samples.append(elapsed * 1000)
+        queries += counter['queries']
+        errors += status != ROUTE_OK.get(name, 200)
+    return {**load_summary(samples, errors, busy), 'queries_per_request': round(queries / repeat, 1)}
+
+
+def run_route_http(name, base_url, threads, repeat):
+    import threading
+    role, prepare = ROUTE_STEPS[name]
+    new_session = lambda: HTTPSession(base_url)  # noqa: E731
+    users = ['guru1' if role == 'guru' else f'murid{t + 1}' for t in range(threads)]
+    sessions = [logged_in(new_session, u) for u in users]
+    barrier = threading.Barrier(threads + 1)
+    results = [None] * threads
+
+    def worker(t):
+        samples, errors = [], 0
+        barrier.wait()
+        for _ in range(repeat):
+            s, method, path, data = prepare(new_session, sessions[t], users[t])
+            start = time.perf_counter()
+            try:
+                status, _ = s.request(method, path, data)
+            except OSError:
+                status = None
+            samples.append((time.perf_counter() - start) * 1000)
+            errors += status != ROUTE_OK.get(name, 200)
+        results[t] = (samples, errors)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for th in pool:
+        th.join()
+    # throughput memakai waktu dinding; untuk quiz_post termasuk GET /quiz sebelum submit
+    elapsed = time.perf_counter() - start
+    return load_summary([ms for samples, _ in results for ms in samples], sum(e for _, e in results), elapsed)
+
+
+def bench_routes(args):
+    import logging
+    import threading
+    from werkzeug.serving import make_server
+    reset_db()
+    generate_school(args.students, args.questions, args.scores, password='bench')
+    login_client('guru1', role='guru')
+    db.session.remove()
+    rows = []
+    for name in ROUTE_STEPS:
+        rows.append({'route': name, 'runner': 'client', **run_route_client(name, args.repeat)})
+    db.session.remove()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-http', daemon=True).start()
+    try:
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        for name in ROUTE_STEPS:
+            rows.append({'route': name, 'runner': f'http x{args.threads}',
+                         **run_route_http(name, base_url, args.threads, args.repeat)})
+    finally:
+        server.shutdown()
+    score_writer.stop()
+    report('routes', rows)
+
+
+# ---------- Server produksi (serve.py) ----------
+def bench_server_startup(args):
+    import subprocess
+    import threading
+    reset_db()
+    generate_school(args.students, args.questions, args.scores, password='bench')
+    db.session.remove()
+    workers = 4
+    rows = []
+    for preload in (False, True):
+        cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+               '--port', '0', '--workers', str(workers)] + ([] if preload else ['--no-preload'])
+        env = {**os.environ, 'BIOKUIZ_CACHE_BACKEND': os.path.join(_tmpdir, f'cache-{preload}.sqlite')}
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stderr=subprocess.PIPE, text=True, env=env)
+        events = []
+        for line in proc.stderr:
+            if line.startswith('[serve] '):
+                msg, _, data = line[8:].partition(' {')
+                events.append((msg, json.loads('{' + data) if data else {}))
+                if sum(1 for m, _ in events if m == 'memori worker idle') == workers:
+                    break
+        startup_s = time.perf_counter() - start  # termasuk start interpreter & impor
+        # sisa log (akses) tetap dibaca supaya pipe tidak penuh
+        threading.Thread(target=proc.stderr.read, daemon=True).start()
+        info = {m: d for m, d in events}
+        memory = [d for m, d in events if m == 'memori worker idle']
+        base_url = f'http://127.0.0.1:{info["app dimuat"]["port"]}'
+        # request pertama tiap sesi baru: template & cache dingin tanpa preload
+        first_ms = []
+        for i in range(workers * 2):
+            session = logged_in(lambda: HTTPSession(base_url), f'murid{i + 1}')
+            t = time.perf_counter()
+            session.request('GET', '/quiz')
+            first_ms.append((time.perf_counter() - t) * 1000)
+        t = time.perf_counter()
+        proc.terminate()
+        proc.wait(timeout=60)
+        rows.append({'preload': preload, 'workers': workers,
+                     'startup_s': round(startup_s, 2), 'ready_s': info['worker siap']['startup_s'],
+                     'worker_rss_mb': round(sum(m['rss_kb'] for m in memory) / len(memory) / 1024, 1),
+                     'worker_pss_mb': round(sum(m['pss_kb'] for m in memory) / len(memory) / 1024, 1),
+                     'worker_uss_mb': round(sum(m['uss_kb'] for m in memory) / len(memory) / 1024, 1),
+                     'first_quiz_ms_max': round(max(first_ms), 1),
+                     'first_quiz_ms_p50': round(percentile(first_ms, 50), 1),
+                     'shutdown_s': round(time.perf_counter() - t, 2)})
+    report('server_startup', rows)
+
+
+BENCHMARKS = {
+    'grading': bench_grading,
+    'report': bench_report,
+    'export': bench_export,
+    'leaderboard': bench_leaderboard,
+    'quiz_session': bench_quiz_session,
+    'quiz_render': bench_quiz_render,
+    'quiz_submit': bench_quiz_submit,
+    'exam': bench_exam,
+    'db_profiles': bench_db_profiles,
+    'dashboard': bench_dashboard,
+    'question_import': bench_question_import,
+    'admin_pages': bench_admin_pages,
+    'search': bench_search,
+    'report_jobs': bench_report_jobs,
+    'login_storm': bench_login_storm,
+    'user_loader': bench_user_loader,
+    'static_assets': bench_static_assets,
+    'material_images': bench_material_images,
+    'item_stats': bench_item_stats,
+    'routes': bench_routes,
+    'server_startup': bench_server_startup,
+}
+
+
+def git_commit():
+    import subprocess
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Biokuiz')
+    parser.add_argument('names', nargs='*', help='benchmark yang dijalankan: ' + ', '.join(BENCHMARKS) + ' (default: semua)')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--json', metavar='FILE', help='simpan hasil sebagai JSON untuk dibandingkan antar commit')
+    group = parser.add_argument_group('routes', 'ukuran sekolah sintetis & jumlah thread klien HTTP')
+    group.add_argument('--students', type=int, default=500)
+    group.add_argument('--questions', type=int, default=200)
+    group.add_argument('--scores', type=int, default=50000)
+    group.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args(argv)
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error('benchmark tidak dikenal: ' + ', '.join(unknown))
+    if args.students <= args.threads:
+        parser.error('--students harus lebih besar dari --threads')
+    app.config['PASSWORD_HASH_METHOD'] = BENCH_HASH_METHOD
+    with app.app_context():
+        for name in args.names or BENCHMARKS:
+            BENCHMARKS[name](args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'commit': git_commit(), 'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+                       'python': sys.version.split()[0], 'args': vars(args), 'results': RESULTS},
+                      f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,125 @@
 import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Profil koneksi database, dipilih lewat BIOKUIZ_DB_PROFILE.
+# - dev: bawaan SQLAlchemy, cocok untuk development
+# - sqlite-production: SQLite dengan WAL, busy_timeout dan cache lebih besar
+# - pooled: untuk MySQL/PostgreSQL (pool koneksi + pre-ping)
+DB_PROFILES = {
+    'dev': {
+        'engine_options': {},
+        'sqlite_pragmas': {},
+    },
+    'sqlite-production': {
+        'engine_options': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30},
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,        # ms
+            'mmap_size': 268435456,      # 256 MB
+            'cache_size': -65536,        # 64 MB (nilai negatif = KiB)
+            'temp_store': 'MEMORY',
+        },
+    },
+    'pooled': {
+        'engine_options': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30,
+                           'pool_recycle': 1800, 'pool_pre_ping': True},
+        'sqlite_pragmas': {},
+    },
+}
+
+
 class Config:
     SECRET_KEY = 'biokuiz-secret-key'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///biokuiz.db'
+    # bisa diganti lewat environment (misal untuk benchmark dengan database sementara)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BIOKUIZ_DATABASE_URI', 'sqlite:///biokuiz.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    DB_PROFILE = os.environ.get('BIOKUIZ_DB_PROFILE', 'dev')
+    SQLALCHEMY_ENGINE_OPTIONS = DB_PROFILES[DB_PROFILE]['engine_options']
+    # dijalankan di setiap koneksi SQLite baru (lihat install_sqlite_pragmas di app.py)
+    SQLITE_PRAGMAS = DB_PROFILES[DB_PROFILE]['sqlite_pragmas']
+
+    # Instrumentasi per request (waktu, jumlah query) untuk /admin/metrics
+    METRICS_ENABLED = os.environ.get('BIOKUIZ_METRICS', '0') == '1'
+
+    # Cache fragmen HTML & statistik: LRU di memori per proses, opsional
+    # dibagi antar proses lewat file SQLite (isi path di BIOKUIZ_CACHE_BACKEND)
+    CACHE_TTL = 300  # detik
+    CACHE_MAX_ENTRIES = 512
+    CACHE_BACKEND = os.environ.get('BIOKUIZ_CACHE_BACKEND')
+    DASHBOARD_CACHE_TTL = 60  # statistik dashboard guru ikut berubah karena nilai baru
+    DASHBOARD_CHART_DAYS = 30  # jendela default grafik rata-rata harian (0 = semua)
+
+    # Zona waktu sekolah (jam dari UTC), untuk batas hari di leaderboard & grafik harian
+    LOCAL_UTC_OFFSET = 7  # WIB
+
+    # Leaderboard: cache peringkat di memori, dibangun ulang setelah TTL (detik)
+    LEADERBOARD_TTL = 60
+    LEADERBOARD_SIZE = 20
+
+    # Daftar admin & API: jumlah baris per halaman (paginasi keyset)
+    ADMIN_PAGE_SIZE = 50
+    ADMIN_PAGE_SIZE_MAX = 200
+
+    # Pencarian teks penuh: jumlah hasil maksimum per jenis (materi / soal)
+    SEARCH_RESULT_LIMIT = 20
+
+    # Kuis: jumlah soal acak per percobaan dan jumlah soal per halaman
+    QUIZ_QUESTION_COUNT = 20
+    QUIZ_PAGE_SIZE = 10
+    # Mode ujian: batas waktu per percobaan dari server (detik, 0 = tanpa batas)
+    # dan toleransi untuk autosave/submit yang terlambat karena jaringan
+    QUIZ_TIME_LIMIT = int(os.environ.get('BIOKUIZ_QUIZ_TIME_LIMIT', 0))
+    QUIZ_DEADLINE_GRACE = 15
+    QUIZ_AUTOSAVE_MAX_ANSWERS = 50  # jawaban per request autosave
+
+    # Penulisan nilai kuis: 'batch' = dikumpulkan oleh worker latar belakang
+    # dan di-commit bersama (group commit), 'sync' = commit langsung per submit
+    SCORE_WRITE_MODE = 'batch'
+    SCORE_BATCH_SIZE = 100
+    SCORE_BATCH_DELAY = 0.05  # detik maksimum menunggu batch terisi
+    SCORE_QUEUE_SIZE = 1000
+    SCORE_WRITE_TIMEOUT = 10  # detik request menunggu batch-nya di-commit
+
+    # Analisis butir soal di laporan guru: jumlah soal yang ditampilkan (tersulit dulu)
+    ITEM_ANALYSIS_LIMIT = 50
+
+    # Job ekspor nilai di latar belakang: jumlah thread (dibuat kecil supaya
+    # tidak merebut CPU & database dari kuis), batas job aktif per guru,
+    # batas waktu sebelum job dianggap gagal (detik), dan folder file hasil
+    REPORT_WORKERS = 1
+    REPORT_MAX_ACTIVE_PER_USER = 2
+    REPORT_JOB_TIMEOUT = 900
+    REPORT_DIR = os.environ.get('BIOKUIZ_REPORT_DIR')  # default: instance/reports
+
+    # Aset statis hasil `flask build-assets` (nama berisi hash isi file)
+    ASSET_DIR = os.path.join(basedir, 'static', 'dist')
+    ASSET_IMAGE_WIDTHS = (400, 800)  # lebar varian gambar materi (px)
+    ASSET_MAX_AGE = 365 * 24 * 3600  # detik, dengan Cache-Control immutable
+
+    # Gambar materi yang diupload (nama file = hash isi) dan thumbnail-nya
+    MEDIA_DIR = os.environ.get('BIOKUIZ_MEDIA_DIR')  # default: instance/media
+    MEDIA_MAX_BYTES = 10 * 1024 * 1024
+    # Batas body request: satu gambar + field form materi. Body yang lebih besar
+    # ditolak (413) sebelum dibaca. Impor bank soal memakai batasnya sendiri.
+    MAX_CONTENT_LENGTH = MEDIA_MAX_BYTES + 256 * 1024
+    QUESTION_IMPORT_MAX_BYTES = 50 * 1024 * 1024
+    MEDIA_THUMB_WIDTHS = (320, 640, 960)  # px
+    MEDIA_THUMB_WORKERS = 1
+
+    # Cache data user untuk current_user (per proses): TTL detik & jumlah entri
+    USER_CACHE_TTL = 30
+    USER_CACHE_MAX_ENTRIES = 10000
+
+    # Hash password dalam format metode Werkzeug: 'pbkdf2:sha256:<iterasi>'
+    # atau 'scrypt:<n>:<r>:<p>'. Hash dengan metode lain diperbarui otomatis
+    # saat user berhasil login.
+    PASSWORD_HASH_METHOD = os.environ.get('BIOKUIZ_PASSWORD_HASH', 'pbkdf2:sha256:600000')
+    # jumlah hash yang dihitung bersamaan; login lain menunggu di antrean
+    PASSWORD_HASH_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+    PASSWORD_HASH_TIMEOUT = 10  # detik menunggu antrean sebelum login ditolak (503)
+
     # 🔹 Konfigurasi Flask-Mail (gunakan akun Gmail)
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
@@ -1,10 +1,36 @@
-from app import db, Material, Question, User
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from app import (db, DailyScoreRollup, Material, Question, Score, StudentStats, User,
+                 ensure_search_index, invalidate_answer_key, leaderboard_cache, migrate_answer_stats_batch,
+                 migrate_question_choices, migrate_quiz_attempt_columns, page_cache, rebuild_daily_rollup,
+                 rebuild_search_index, rebuild_student_stats, search_index_ready)
 from app import app
+from sqlalchemy.schema import CreateIndex
 from werkzeug.security import generate_password_hash
 
-with app.app_context():
+
+def init_db():
     db.create_all()
 
+    # create_all tidak menambah index ke tabel yang sudah ada; IF NOT EXISTS
+    # karena checkfirst tidak bisa membaca index ekspresi (lower(title))
+    with db.engine.begin() as conn:
+        for table in (Score.__table__, Question.__table__, Material.__table__):
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+    # kolom choice_list untuk database yang dibuat sebelum pilihan jawaban terstruktur
+    migrate_question_choices()
+    # kolom mode ujian & hasil kuis untuk database yang dibuat sebelumnya
+    migrate_quiz_attempt_columns()
+    # ItemStats per baris Answer (dulu cursor id) untuk database yang dibuat sebelumnya
+    migrate_answer_stats_batch()
+
+    # index pencarian FTS5, dibangun ulang dari isi tabel materi & soal di bawah
+    search_ready = ensure_search_index()
+
     # sample material (jika belum ada)
     if Material.query.count() == 0:
         m1 = Material(
@@ -56,4 +82,75 @@ Kulit mengeluarkan keringat yang membantu ekskresi.
         db.session.add(u)
 
     db.session.commit()
-    print("Database dibuat / diperbarui dengan data sample.")
+
+    # isi tabel ringkasan nilai untuk database lama yang sudah punya Score
+    if StudentStats.query.count() == 0 and Score.query.count() > 0:
+        rebuild_student_stats()
+    if DailyScoreRollup.query.count() == 0 and Score.query.count() > 0:
+        rebuild_daily_rollup()
+    if search_ready:
+        rebuild_search_index()
+
+
+# ----- Data sintetis (benchmark / uji beban) -----
+def bulk_insert(table, rows, chunk=50000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+
+
+def generate_school(students, questions=0, scores=0, seed=42, start=None, days=365, password='password'):
+    # Tambah `students` murid (murid<id-1>), `questions` soal dan `scores` nilai
+    # dengan bulk insert, lalu bangun ulang tabel ringkasan. Semua murid
+    # memakai password yang sama (di-hash sekali) supaya bisa login saat uji
+    # beban. Nilai dibagi rata: nilai ke-i milik murid ke-(i % students).
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    start = start or now - timedelta(days=days)
+    password_hash = generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+    first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    bulk_insert(User.__table__, (
+        {'username': f'murid{first_user - 1 + i}', 'password_hash': password_hash, 'role': 'murid', 'created_at': now}
+        for i in range(students)
+    ))
+    bulk_insert(Question.__table__, (
+        {'text': f'Soal nomor {i} tentang sistem ekskresi', 'qtype': 'mcq',
+         'choices': 'A||Ginjal;;B||Hati;;C||Paru-paru;;D||Kulit', 'correct': rnd.choice('ABCD'),
+         'choice_list': [['A', 'Ginjal'], ['B', 'Hati'], ['C', 'Paru-paru'], ['D', 'Kulit']]}
+        for i in range(questions)
+    ))
+    if students:
+        bulk_insert(Score.__table__, (
+            {'user_id': first_user + i % students, 'score': rnd.randint(0, 100), 'total': 10,
+             'taken_at': start + timedelta(minutes=rnd.randint(0, 60 * 24 * days))}
+            for i in range(scores)
+        ))
+    db.session.commit()
+    rebuild_student_stats()
+    rebuild_daily_rollup()
+    if questions:
+        invalidate_answer_key()
+        if search_index_ready(db.session.connection()):
+            rebuild_search_index()
+    leaderboard_cache.invalidate()
+    page_cache.invalidate('dashboard', 'question')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Buat / perbarui database Biokuiz')
+    parser.add_argument('--students', type=int, default=0, help='tambah N murid sintetis (murid0, murid1, ...)')
+    parser.add_argument('--questions', type=int, default=0, help='tambah M soal sintetis')
+    parser.add_argument('--scores', type=int, default=0, help='tambah K nilai sintetis, dibagi rata ke murid baru')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    with app.app_context():
+        init_db()
+        print("Database dibuat / diperbarui dengan data sample.")
+        if args.students or args.questions:
+            generate_school(args.students, args.questions, args.scores, seed=args.seed)
+            print(f"Data sintetis: {args.students} murid, {args.questions} soal, {args.scores} nilai.")
@@ -0,0 +1,170 @@
+# Server produksi Biokuiz: beberapa worker hasil fork dari satu proses induk.
+# Jalankan: python serve.py --workers 4 --port 8000
+# Induk memuat app, template dan cache sekali sebelum fork, lalu mengawasi
+# worker (worker yang mati diganti). SIGTERM / Ctrl-C: worker berhenti
+# menerima koneksi baru, menyelesaikan request yang sedang berjalan dan
+# antrian nilai, lalu keluar. Hanya untuk Linux/Unix (os.fork).
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+started = time.perf_counter()
+
+
+def elapsed():
+    return round(time.perf_counter() - started, 3)
+
+
+def memory_kb(pid):
+    # RSS, PSS (halaman bersama dibagi rata) dan USS (halaman milik worker sendiri)
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        return {}
+    return {'rss_kb': usage['Rss'], 'pss_kb': usage['Pss'],
+            'uss_kb': usage['Private_Clean'] + usage['Private_Dirty']}
+
+
+def log(msg, **data):
+    print(f'[serve] {msg}' + (' ' + json.dumps(data) if data else ''), file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Server produksi Biokuiz (pre-fork)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='0 = port acak (dicetak saat start)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help='detik menunggu worker selesai sebelum dihentikan paksa')
+    parser.add_argument('--keepalive', type=float, default=5, help='detik koneksi keep-alive boleh menganggur')
+    parser.add_argument('--no-preload', action='store_true',
+                        help='jangan muat template & cache sebelum fork (untuk perbandingan)')
+    args = parser.parse_args(argv)
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as biokuiz
+    app = biokuiz.create_app()
+    imported = elapsed()
+
+    if args.workers > 1 and not app.config['CACHE_BACKEND']:
+        # invalidasi cache (materi, soal, kunci jawaban) harus terlihat di semua worker
+        os.makedirs(app.instance_path, exist_ok=True)
+        app.config['CACHE_BACKEND'] = os.path.join(app.instance_path, 'cache.sqlite')
+        log('CACHE_BACKEND tidak diisi, memakai ' + app.config['CACHE_BACKEND'])
+
+    warmed = {}
+    with app.app_context():
+        if not args.no_preload:
+            biokuiz.preload_app()
+            warmed = biokuiz.warm_caches()
+        # jangan wariskan koneksi database ke worker
+        biokuiz.db.engine.dispose()
+    biokuiz.page_cache.reset_backend()
+
+    class RequestHandler(WSGIRequestHandler):
+        timeout = args.keepalive
+
+    server = make_server(args.host, args.port, app, threaded=True, request_handler=RequestHandler)
+    server.daemon_threads = False  # server_close() di worker menunggu request yang sedang berjalan
+    preloaded = elapsed()
+    log('app dimuat', import_s=imported, preload_s=preloaded, port=server.server_port, **warmed)
+
+    ready_r, ready_w = os.pipe()
+    workers = {}  # pid -> waktu dibuat
+    deadline = []
+
+    def stop(signum, _frame):
+        if not deadline:
+            deadline.append(time.monotonic() + args.graceful_timeout)
+            log('berhenti', signal=signal.Signals(signum).name)
+            for pid in workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    # dipasang sebelum fork: sinyal saat start tetap menghentikan worker yang sudah dibuat
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    stop_signals = {signal.SIGTERM, signal.SIGINT}
+
+    def spawn(notify=None):
+        # sinyal ditahan selama fork supaya worker tidak sempat menjalankan handler
+        # milik induk, dan induk sudah mencatat pid-nya sebelum sinyal diproses
+        signal.pthread_sigmask(signal.SIG_BLOCK, stop_signals)
+        pid = os.fork()
+        if pid:
+            workers[pid] = time.monotonic()
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, stop_signals)
+            return
+        # ---- worker ----
+        try:
+            for sig in stop_signals:
+                signal.signal(sig, lambda *_: threading.Thread(target=server.shutdown).start())
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, stop_signals)
+            biokuiz.after_fork()
+            if notify is not None:
+                os.close(ready_r)
+                os.write(notify, b'.')
+                os.close(notify)
+            server.serve_forever()  # kembali setelah shutdown
+            server.server_close()  # menunggu thread request yang masih berjalan
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)  # jangan sampai kembali ke loop milik induk
+        sys.exit(0)  # atexit: antrian nilai & job latar belakang dihentikan dengan rapi
+
+    for _ in range(args.workers):
+        if deadline:
+            break
+        spawn(ready_w)
+    os.close(ready_w)
+    ready = 0
+    while ready < len(workers):
+        chunk = os.read(ready_r, args.workers)
+        if not chunk:
+            break  # semua worker keluar sebelum siap (mis. dihentikan saat start)
+        ready += len(chunk)
+    os.close(ready_r)
+    log('worker siap', workers=ready, startup_s=elapsed())
+    time.sleep(0.2)
+    for pid in workers:
+        log('memori worker idle', pid=pid, **memory_kb(pid))
+
+    # induk tidak melayani request, socket tetap dibuka untuk worker pengganti
+    killed = False
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if deadline and not killed and time.monotonic() > deadline[0]:
+                for pid in workers:
+                    log('worker dihentikan paksa', pid=pid)
+                    os.kill(pid, signal.SIGKILL)
+                killed = True
+            time.sleep(0.1)
+            continue
+        born = workers.pop(pid, None)
+        if not deadline:
+            log('worker mati, diganti', pid=pid, status=status)
+            if born is not None and time.monotonic() - born < 1:
+                time.sleep(1)  # worker langsung mati (mis. error saat start): jangan berputar cepat
+            spawn()
+    log('selesai')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())